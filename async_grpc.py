@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.GRPCClient.CCD_Types import CCD_VersionedModuleSource
+from rich.console import Console
+
+console = Console()
+
+
+class AsyncGRPCClient:
+    """
+    Async access to the blocking `GRPCClient` without stalling the event loop.
+
+    Calls run in a thread pool. Every network has a pool of up to `pool_size`
+    `GRPCClient` instances, each with its own channels, so concurrent calls do
+    not queue on a single connection and a client is used by one thread at a
+    time. The client passed in starts the mainnet pool; the others are created
+    when a pool runs dry. A caller waits at most `deadline` seconds for a call.
+    `GRPCClient` sets its own per-RPC timeout, which cannot be passed in, so a
+    call that outlives the deadline keeps its client (and thread) until it
+    returns, and only then goes back to the pool.
+    """
+
+    def __init__(self, grpcclient: GRPCClient, pool_size: int, deadline: float):
+        self.grpcclient = grpcclient
+        self.pool_size = max(1, pool_size)
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.pool_size * len(NET), thread_name_prefix="grpc"
+        )
+        # one instance per pool, so the networks never share a client
+        self.idle: dict[NET, list[GRPCClient]] = {
+            net: [grpcclient] if net == NET.MAINNET else [] for net in NET
+        }
+        self.created: dict[NET, int] = {net: len(self.idle[net]) for net in NET}
+        self.available: dict[NET, asyncio.Semaphore] = {
+            net: asyncio.Semaphore(self.pool_size) for net in NET
+        }
+
+    async def acquire(self, net: NET) -> GRPCClient:
+        await self.available[net].acquire()
+        if self.idle[net]:
+            return self.idle[net].pop()
+        self.created[net] += 1
+        console.log(f"GRPC pool for {net.value}: opening client {self.created[net]}.")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, GRPCClient
+            )
+        except BaseException:
+            self.created[net] -= 1
+            self.available[net].release()
+            raise
+
+    def release(self, net: NET, client: GRPCClient):
+        self.idle[net].append(client)
+        self.available[net].release()
+
+    async def call(self, net: NET, method: Callable[[GRPCClient], object]):
+        client = await self.acquire(net)
+        running = asyncio.get_running_loop().run_in_executor(
+            self.executor, method, client
+        )
+        try:
+            # shielded, so a timeout does not mark the still running call as done
+            return await asyncio.wait_for(
+                asyncio.shield(running), timeout=self.deadline
+            )
+        finally:
+            if running.done():
+                self.release(net, client)
+            else:
+                console.log(
+                    f"GRPC pool for {net.value}: call exceeded the deadline, client held until it returns."
+                )
+                running.add_done_callback(
+                    lambda future: self.returned(net, client, future)
+                )
+
+    def returned(self, net: NET, client: GRPCClient, future: asyncio.Future):
+        # the caller has given up on this result; retrieve it, so it is not reported
+        if not future.cancelled():
+            future.exception()
+        self.release(net, client)
+
+    async def get_module_source(
+        self, module_ref: str, block_hash: str, net: NET
+    ) -> CCD_VersionedModuleSource:
+        return await self.call(
+            net, lambda client: client.get_module_source(module_ref, block_hash, net)
+        )
@@ -0,0 +1,234 @@
+"""
+Extracts the metadata of existing modules again and/or verifies them again,
+for example after a cargo-concordium upgrade or a change to the module index.
+
+Modules are selected by network, verification status, build image and
+verification date, and read in pages of `--chunk` modules ordered by `_id`. Up
+to `--parallel` modules of a page are handled at a time. After every page the
+buffered writes are flushed and the last `_id` is stored in the
+`backfill_checkpoints` collection (utilities database), so an interrupted run
+continues where it stopped when started again with the same arguments.
+
+    python backfill.py --verify --status verified_failed --net mainnet
+    python backfill.py --metadata --parallel 16
+    python backfill.py --verify --force --build-image docker.io/concordium/verifiable-sc:1.70.0
+"""
+
+import argparse
+import asyncio
+import atexit
+import datetime as dt
+import json
+import os
+from typing import Optional
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.GRPCClient import GRPCClient
+from ccdexplorer_fundamentals.mongodb import Collections, MongoMotor
+from ccdexplorer_fundamentals.tooter import Tooter
+from pymongo.collection import Collection
+from rich.console import Console
+from rich.progress import Progress
+
+from async_grpc import AsyncGRPCClient
+from concordium_client import ConcordiumClient
+from env import GRPC_DEADLINE, GRPC_POOL_SIZE
+from subscriber import Subscriber
+from subscriber.module import batches
+
+console = Console()
+# Suppress logging warnings
+os.environ["GRPC_VERBOSITY"] = "ERROR"
+
+
+def parse_date(text: str) -> dt.datetime:
+    date = dt.datetime.fromisoformat(text)
+    return date if date.tzinfo else date.replace(tzinfo=dt.UTC)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("\n\n", 1)[1],
+    )
+    parser.add_argument(
+        "--metadata", action="store_true", help="extract metadata again"
+    )
+    parser.add_argument("--verify", action="store_true", help="verify again")
+    parser.add_argument(
+        "--net", choices=[net.value for net in NET], action="append", dest="nets"
+    )
+    parser.add_argument(
+        "--status",
+        action="append",
+        dest="statuses",
+        help="verification.verification_status, e.g. verified_failed (repeatable)",
+    )
+    parser.add_argument("--build-image", help="verification.build_image_used")
+    parser.add_argument(
+        "--since", type=parse_date, help="verified at or after (ISO date)"
+    )
+    parser.add_argument("--until", type=parse_date, help="verified before (ISO date)")
+    parser.add_argument(
+        "--force", action="store_true", help="do not reuse cached verification results"
+    )
+    parser.add_argument(
+        "--notify",
+        action="store_true",
+        help="send every verification result to the tooter",
+    )
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument(
+        "--chunk", type=int, default=100, help="modules per page and bulk write"
+    )
+    parser.add_argument(
+        "--name", help="checkpoint name; defaults to one derived from the arguments"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint and start over"
+    )
+    args = parser.parse_args()
+    if not args.metadata and not args.verify:
+        parser.error("choose --metadata, --verify or both")
+    return args
+
+
+def build_query(args) -> dict:
+    query = {}
+    if args.statuses:
+        query["verification.verification_status"] = {"$in": args.statuses}
+    if args.build_image:
+        query["verification.build_image_used"] = args.build_image
+    if args.since or args.until:
+        query["verification.verification_timestamp"] = {}
+        if args.since:
+            query["verification.verification_timestamp"]["$gte"] = args.since
+        if args.until:
+            query["verification.verification_timestamp"]["$lt"] = args.until
+    return query
+
+
+def checkpoint_id(args, net: NET) -> str:
+    if args.name:
+        return f"{args.name}/{net.value}"
+    selection = {
+        "metadata": args.metadata,
+        "verify": args.verify,
+        "force": args.force,
+        "statuses": sorted(args.statuses or []),
+        "build_image": args.build_image,
+        "since": args.since.isoformat() if args.since else None,
+        "until": args.until.isoformat() if args.until else None,
+    }
+    return f"{net.value}/{json.dumps(selection, sort_keys=True)}"
+
+
+async def handle_module(subscriber: Subscriber, args, net: NET, module: dict):
+    module_ref = module["_id"]
+    context = None
+    if args.metadata:
+        context = await subscriber.refresh_module_metadata(net, module_ref)
+    if args.verify:
+        await subscriber.verify_module(
+            net,
+            subscriber.concordium_client,
+            {
+                "_id": module_ref,
+                "module_name": module.get("module_name"),
+                "force_reverify": args.force,
+            },
+            context,
+            notify=args.notify,
+        )
+
+
+async def backfill_net(
+    subscriber: Subscriber, checkpoints: Collection, args, net: NET, query: dict
+):
+    _id = checkpoint_id(args, net)
+    checkpoint: Optional[dict] = None
+    if not args.restart:
+        checkpoint = await checkpoints.find_one({"_id": _id})
+    if checkpoint and checkpoint.get("done"):
+        console.log(f"{net.value}: already done ({checkpoint['processed']} modules).")
+        return
+    last_id = checkpoint["last_id"] if checkpoint else None
+    processed = checkpoint["processed"] if checkpoint else 0
+    failed = checkpoint["failed"] if checkpoint else 0
+    if last_id is not None:
+        console.log(f"{net.value}: resuming after {last_id} ({processed} done).")
+
+    db = subscriber.motor_mainnet if net == NET.MAINNET else subscriber.motor_testnet
+    collection = db[Collections.modules]
+    remaining_query = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+    total = await collection.count_documents(remaining_query)
+    available = asyncio.Semaphore(args.parallel)
+
+    async def one(module: dict) -> bool:
+        async with available:
+            try:
+                await handle_module(subscriber, args, net, module)
+                return True
+            except Exception as e:
+                console.log(f"{net.value}: {module['_id']} failed with error {e}.")
+                return False
+
+    with Progress(console=console) as progress:
+        task = progress.add_task(f"{net.value}", total=total)
+        async for batch in batches(
+            collection,
+            query,
+            {"_id": 1, "module_name": 1},
+            args.chunk,
+            after=last_id,
+        ):
+            results = await asyncio.gather(*[one(module) for module in batch])
+            # results first, then the checkpoint that skips them on a resume
+            await subscriber.write_buffer.flush(net)
+            processed += len(batch)
+            failed += results.count(False)
+            await checkpoints.replace_one(
+                {"_id": _id},
+                {
+                    "_id": _id,
+                    "net": net.value,
+                    "last_id": batch[-1]["_id"],
+                    "processed": processed,
+                    "failed": failed,
+                    "done": False,
+                    "updated_at": dt.datetime.now().astimezone(dt.UTC),
+                },
+                upsert=True,
+            )
+            progress.advance(task, len(batch))
+
+    await checkpoints.update_one({"_id": _id}, {"$set": {"done": True}}, upsert=True)
+    console.log(f"{net.value}: {processed} modules, {failed} failed.")
+
+
+async def main():
+    args = parse_args()
+    tooter = Tooter()
+    motormongo = MongoMotor(tooter)
+    grpcclient = GRPCClient()
+    async_grpcclient = AsyncGRPCClient(grpcclient, GRPC_POOL_SIZE, GRPC_DEADLINE)
+    concordium_client = ConcordiumClient(tooter=tooter, grpcclient=async_grpcclient)
+    subscriber = Subscriber(
+        grpcclient, tooter, motormongo, concordium_client, async_grpcclient
+    )
+    # bulk writes of one page at a time
+    subscriber.write_buffer.max_ops = args.chunk
+    atexit.register(subscriber.exit)
+    await subscriber.ensure_indexes()
+    if args.verify:
+        subscriber.build_images.start()
+
+    checkpoints = motormongo.utilities_db["backfill_checkpoints"]
+    query = build_query(args)
+    for net in [NET(net) for net in args.nets] if args.nets else NET:
+        await backfill_net(subscriber, checkpoints, args, net, query)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
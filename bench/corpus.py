@@ -0,0 +1,191 @@
+import hashlib
+import io
+import random
+import struct
+import tarfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from subscriber.wasm import BUILD_INFO_SECTION, CUSTOM_SECTION, read_name, sections
+
+
+@dataclass
+class CorpusModule:
+    module_ref: str
+    version: int
+    wasm: bytes
+    # source archive (.tar.gz) served for the module's source link, as <archive_name>.tar.gz
+    archive: bytes
+    archive_name: str
+
+
+def leb(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def vec(items: list[bytes]) -> bytes:
+    return leb(len(items)) + b"".join(items)
+
+
+def name(text: str) -> bytes:
+    data = text.encode()
+    return leb(len(data)) + data
+
+
+def section(section_id: int, body: bytes) -> bytes:
+    return bytes([section_id]) + leb(len(body)) + body
+
+
+def string(text: str) -> bytes:
+    data = text.encode()
+    return struct.pack(">Q", len(data)) + data
+
+
+def build_info_section(archive: bytes, source_link: str) -> bytes:
+    """
+    The `concordium-build-info` custom section of a verifiable build.
+    """
+    image = "docker.io/concordium/verifiable-sc:bench"
+    command = ["cargo", "concordium", "build", "--verifiable", image]
+    body = (
+        b"\x00"
+        + hashlib.sha256(archive).digest()
+        + b"\x01"
+        + string(source_link)
+        + string(image)
+        + struct.pack(">Q", len(command))
+        + b"".join(string(argument) for argument in command)
+    )
+    return section(0, name(BUILD_INFO_SECTION) + body)
+
+
+def synthetic_wasm(
+    contract: str,
+    methods: list[str],
+    code_size: int,
+    schema_size: int,
+    build_info: bytes,
+) -> bytes:
+    """
+    A valid Wasm module shaped like a contract: an `init_` function, one
+    receive function per method, `code_size` bytes of code per function, a
+    `concordium-schema` custom section of `schema_size` bytes and the given
+    build info section.
+    """
+    functions = [f"init_{contract}"] + [f"{contract}.{method}" for method in methods]
+    count = len(functions)
+    body = b"\x00" + b"\x01" * code_size + b"\x0b"
+    return (
+        b"\x00asm\x01\x00\x00\x00"
+        + section(1, vec([b"\x60" + vec([b"\x7e"]) + vec([b"\x7f"])]))
+        + section(3, vec([leb(0)] * count))
+        + section(5, vec([b"\x00" + leb(1)]))
+        + section(
+            7,
+            vec(
+                [name(f) + b"\x00" + leb(i) for i, f in enumerate(functions)]
+                + [name("memory") + b"\x02" + leb(0)]
+            ),
+        )
+        + section(10, vec([leb(len(body)) + body] * count))
+        + section(0, name("concordium-schema") + bytes(schema_size))
+        + build_info
+    )
+
+
+def source_archive(contract: str, source_size: int) -> bytes:
+    """
+    A `.tar.gz` laid out like the archives of `cargo concordium build --verifiable`:
+    one top-level package directory.
+    """
+    files = {
+        "Cargo.toml": f'[package]\nname = "{contract}"\nversion = "0.1.0"\n'.encode(),
+        "Cargo.lock": b"# bench\n",
+        "src/lib.rs": b"// bench\n" + b"x" * source_size,
+    }
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for path, data in files.items():
+            info = tarfile.TarInfo(f"{contract}/{path}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def synthetic_corpus(count: int, archive_url: str, seed: int = 1) -> list[CorpusModule]:
+    """
+    Synthetic modules whose build info links to `<archive_url>/<contract>.tar.gz`.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        contract = f"bench_{index}"
+        methods = [f"method_{m}" for m in range(rng.randint(1, 40))]
+        archive = source_archive(contract, rng.randint(1_000, 200_000))
+        wasm = synthetic_wasm(
+            contract,
+            methods,
+            rng.randint(1_000, 100_000),
+            rng.randint(0, 20_000),
+            build_info_section(archive, f"{archive_url}/{contract}.tar.gz"),
+        )
+        corpus.append(
+            CorpusModule(hashlib.sha256(wasm).hexdigest(), 1, wasm, archive, contract)
+        )
+    return corpus
+
+
+def with_build_info(wasm: bytes, build_info: bytes) -> bytes:
+    """
+    `wasm` with its build info section, if any, replaced by `build_info`.
+    """
+    kept = []
+    # sections follow each other, so each one starts where the previous ended
+    offset = 8
+    for section_id, start, end in sections(wasm):
+        if (
+            section_id != CUSTOM_SECTION
+            or read_name(wasm, start)[0] != BUILD_INFO_SECTION
+        ):
+            kept.append(wasm[offset:end])
+        offset = end
+    return wasm[:8] + b"".join(kept) + build_info
+
+
+def recorded_corpus(
+    directory: str, archive_url: str, limit: Optional[int] = None
+) -> list[CorpusModule]:
+    """
+    Reads a recorded corpus: `<module_ref>.out` files in the versioned module
+    format anywhere below `directory` (a copy of `MODULE_STORE_DIR` will do)
+    and, optionally, `archives/<module_ref>.tar.gz`. Modules without an archive
+    get a generated one. The build info of every module is replaced by one that
+    links to `<archive_url>/<module_ref>.tar.gz`, so no real source link is
+    fetched.
+    """
+    root = Path(directory)
+    corpus = []
+    for path in sorted(root.glob("**/*.out"))[:limit]:
+        data = path.read_bytes()
+        version, length = struct.unpack(">II", data[:8])
+        archive_path = root / "archives" / f"{path.stem}.tar.gz"
+        archive = (
+            archive_path.read_bytes()
+            if archive_path.exists()
+            else source_archive(path.stem[:8], 10_000)
+        )
+        wasm = with_build_info(
+            data[8 : 8 + length],
+            build_info_section(archive, f"{archive_url}/{path.stem}.tar.gz"),
+        )
+        corpus.append(CorpusModule(path.stem, version, wasm, archive, path.stem))
+    return corpus
@@ -0,0 +1,248 @@
+"""
+Offline benchmark of module processing and verification.
+
+Replays a corpus of modules through `process_new_module` and `verify_module`
+with local stand-ins: a fake GRPCClient serving the corpus, mongomock (or a
+local mongod with --mongo-uri), a local HTTP server for the source archives
+and a stub `cargo concordium`. Reports throughput and p50/p99 per stage, as
+recorded by the spans of `metrics.py`.
+
+    python bench/run.py --modules 200 --concurrency 8
+    python bench/run.py --corpus path/to/corpus --repeat 3 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).absolute().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--modules", type=int, default=100, help="synthetic modules")
+    parser.add_argument("--corpus", help="recorded corpus directory instead")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--grpc-latency", type=float, default=0.005, help="seconds per fake gRPC call"
+    )
+    parser.add_argument(
+        "--build-seconds",
+        type=float,
+        default=0,
+        help="duration of the stub verify-build",
+    )
+    parser.add_argument("--mongo-uri", help="local mongod instead of mongomock")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args()
+
+
+def configure_environment(workdir: str, args):
+    # settings are read when env.py is imported, so they go first
+    os.environ.setdefault("MQTT_QOS", "1")
+    os.environ["MODULE_STORE_DIR"] = os.path.join(workdir, "modules")
+    os.environ["HTTP_CACHE_DIR"] = os.path.join(workdir, "http_cache")
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["BENCH_BUILD_SECONDS"] = str(args.build_seconds)
+    os.environ["PATH"] = f"{BENCH_DIR / 'stub'}{os.pathsep}{os.environ['PATH']}"
+    os.makedirs(os.path.join(workdir, "tmp"))
+    # the verification stages use paths relative to the working directory
+    os.chdir(workdir)
+
+
+def wadze_metadata(wadze, wasm: bytes) -> dict:
+    """
+    `module_name` and `methods` the way `get_module_metadata` read them with wadze.
+    """
+    module = wadze.parse_module(wasm)
+    results = {}
+    for line in module.get("export", []):
+        if str(line).split("(")[0] == "ExportFunction":
+            name = str(line).split("'")[1]
+            if name[:5] == "init_":
+                results["module_name"] = name[5:]
+            else:
+                method_name = name.split(".")[1] if "." in name else name
+                results.setdefault("methods", []).append(method_name)
+    return results
+
+
+def compare_parsers(corpus) -> dict:
+    """
+    Export section scanner against a full wadze parse, in milliseconds per
+    module. Fails if they disagree on `module_name` or `methods` for any module.
+    """
+    from subscriber.wasm import embedded_schema, exported_functions, module_metadata
+
+    results = {}
+    timings = []
+    scanned = {}
+    for module in corpus:
+        start = time.perf_counter()
+        function_names = exported_functions(module.wasm)
+        embedded_schema(module.wasm)
+        timings.append((time.perf_counter() - start) * 1000)
+        scanned[module.module_ref] = module_metadata(function_names)
+    results["scanner"] = timings
+    try:
+        from ccdexplorer_fundamentals.GRPCClient import wadze
+    except ImportError:
+        return results
+    timings = []
+    mismatches = []
+    for module in corpus:
+        start = time.perf_counter()
+        parsed = wadze_metadata(wadze, module.wasm)
+        timings.append((time.perf_counter() - start) * 1000)
+        if parsed != scanned[module.module_ref]:
+            mismatches.append(module.module_ref)
+    results["wadze"] = timings
+    assert (
+        not mismatches
+    ), f"scanner and wadze disagree on {len(mismatches)} modules: {mismatches[:5]}"
+    print(f"scanner and wadze agree on all {len(corpus)} modules")
+    return results
+
+
+async def replay(subscriber, corpus, concurrency: int):
+    from ccdexplorer_fundamentals.enums import NET
+    from metrics import metrics
+
+    available = asyncio.Semaphore(concurrency)
+
+    async def one(module):
+        async with available:
+            with metrics.span("end_to_end"):
+                msg = {"module_ref": module.module_ref}
+                context = await subscriber.process_new_module(NET.TESTNET, msg)
+                await subscriber.verify_module(
+                    NET.TESTNET,
+                    subscriber.concordium_client,
+                    {**msg, "force_reverify": True},
+                    context,
+                )
+
+    await asyncio.gather(*[one(module) for module in corpus])
+    await subscriber.write_buffer.flush()
+
+
+def report(wall: float, parsers: dict) -> dict:
+    from metrics import metrics
+
+    rows = {}
+    for stage, span in metrics.spans.items():
+        rows[stage] = {
+            "count": span.count,
+            "per_second": span.count / wall if wall else 0,
+            "p50_ms": span.quantile(0.5) * 1000,
+            "p99_ms": span.quantile(0.99) * 1000,
+            "errors": span.errors,
+        }
+    print(
+        f"\n{'stage':<28}{'count':>8}{'per s':>10}{'p50 ms':>12}{'p99 ms':>12}{'errors':>8}"
+    )
+    for stage, row in sorted(rows.items(), key=lambda item: -item[1]["p50_ms"]):
+        print(
+            f"{stage:<28}{row['count']:>8}{row['per_second']:>10.1f}"
+            f"{row['p50_ms']:>12.2f}{row['p99_ms']:>12.2f}{row['errors']:>8}"
+        )
+    print(f"\nwall time {wall:.2f}s")
+    for parser, timings in parsers.items():
+        print(
+            f"{parser}: median {statistics.median(timings):.3f} ms, "
+            f"max {max(timings):.3f} ms per module"
+        )
+    return {
+        "wall_seconds": wall,
+        "stages": rows,
+        "parsers": {
+            parser: {"median_ms": statistics.median(t), "max_ms": max(t)}
+            for parser, t in parsers.items()
+        },
+    }
+
+
+async def main(args):
+    from concordium_client import ConcordiumClient
+    from subscriber import Subscriber
+    from subscriber.module_store import ModuleStore
+
+    from corpus import recorded_corpus, synthetic_corpus
+    from stand_ins import (
+        ArchiveServer,
+        FakeGRPCClient,
+        FakeMotor,
+        FakeTooter,
+        fake_async_grpcclient,
+    )
+
+    archives = Path("archives")
+    archives.mkdir()
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        connection = AsyncIOMotorClient(args.mongo_uri)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+
+        connection = AsyncMongoMockClient()
+
+    with ArchiveServer(str(archives)) as server:
+        os.environ["BENCH_ARCHIVE_URL"] = server.url
+        corpus = (
+            recorded_corpus(args.corpus, server.url)
+            if args.corpus
+            else synthetic_corpus(args.modules, server.url)
+        )
+        for module in corpus:
+            (archives / f"{module.archive_name}.tar.gz").write_bytes(module.archive)
+        tooter = FakeTooter()
+        grpcclient = FakeGRPCClient(corpus, args.grpc_latency)
+        async_grpcclient = fake_async_grpcclient(grpcclient, args.concurrency, 30)
+        subscriber = Subscriber(
+            grpcclient,
+            tooter,
+            FakeMotor(connection),
+            ConcordiumClient(tooter=tooter, grpcclient=async_grpcclient),
+            async_grpcclient,
+        )
+        # no Docker images to manage for the stub build
+        subscriber.build_images.enabled = False
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            # start every round from an empty module store, so modules are fetched
+            shutil.rmtree(os.environ["MODULE_STORE_DIR"], ignore_errors=True)
+            subscriber.module_store = ModuleStore(
+                os.environ["MODULE_STORE_DIR"], subscriber.module_store.max_bytes
+            )
+            await replay(subscriber, corpus, args.concurrency)
+        wall = time.perf_counter() - start
+        await subscriber.http_client.aclose()
+
+    results = report(wall, compare_parsers(corpus))
+    results["modules"] = len(corpus)
+    results["repeat"] = args.repeat
+    return results
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    if args.corpus:
+        args.corpus = os.path.abspath(args.corpus)
+    with tempfile.TemporaryDirectory(prefix="ms-modules-bench-") as workdir:
+        configure_environment(workdir, args)
+        results = asyncio.run(main(args))
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
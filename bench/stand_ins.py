@@ -0,0 +1,88 @@
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from async_grpc import AsyncGRPCClient
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.mongodb import Collections, CollectionsUtilities
+
+from corpus import CorpusModule
+
+
+class FakeTooter:
+    def relay(self, **kwargs):
+        pass
+
+    def send(self, **kwargs):
+        pass
+
+
+class FakeGRPCClient:
+    """
+    Serves `get_module_source` from the corpus, after `latency` seconds.
+    """
+
+    def __init__(self, corpus: list[CorpusModule], latency: float):
+        self.modules = {module.module_ref: module for module in corpus}
+        self.latency = latency
+
+    def get_module_source(self, module_ref: str, block_hash: str, net: NET):
+        time.sleep(self.latency)
+        module = self.modules[module_ref]
+        source = module.wasm.hex()
+        return SimpleNamespace(
+            v0=source if module.version == 0 else None,
+            v1=source if module.version == 1 else None,
+        )
+
+
+def fake_async_grpcclient(
+    grpcclient: FakeGRPCClient, pool_size: int, deadline: float
+) -> AsyncGRPCClient:
+    # fill the pools up front, so no real GRPCClient is ever opened
+    client = AsyncGRPCClient(grpcclient, pool_size, deadline)
+    for net in NET:
+        client.idle[net] = [grpcclient] * client.pool_size
+        client.created[net] = client.pool_size
+    return client
+
+
+class FakeMotor:
+    """
+    The collections of `MongoMotor`, on mongomock or on a given (local) Motor client.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.mainnet_db = connection["bench_mainnet"]
+        self.mainnet = {c: self.mainnet_db[c.value] for c in Collections}
+        self.testnet_db = connection["bench_testnet"]
+        self.testnet = {c: self.testnet_db[c.value] for c in Collections}
+        self.utilities_db = connection["bench_utilities"]
+        self.utilities = {c: self.utilities_db[c.value] for c in CollectionsUtilities}
+
+
+class ArchiveServer:
+    """
+    Serves the files of `directory` over HTTP on a free local port, in a thread.
+    """
+
+    def __init__(self, directory: str):
+        handler = partial(QuietHandler, directory=directory)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
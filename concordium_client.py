@@ -1,11 +1,23 @@
-import copy
-import subprocess
-import time
 import json
 import os
+import struct
+import time
 from enum import Enum
+from typing import Optional
 from ccdexplorer_fundamentals.enums import NET
-from env import GRPC_MAINNET, GRPC_TESTNET
+from async_grpc import AsyncGRPCClient
+from env import (
+    CONCORDIUM_CLIENT_TIMEOUT,
+    GRPC_MAINNET,
+    GRPC_TESTNET,
+    REQUESTOR_BREAKER_COOLDOWN,
+    REQUESTOR_BREAKER_THRESHOLD,
+    REQUESTOR_HEIGHT_CHECK_INTERVAL,
+    REQUESTOR_MAX_BLOCK_LAG,
+    REQUESTOR_RETRY_BUDGET,
+)
+from metrics import metrics
+from runner import CommandResult, run
 
 from rich.console import Console
 
@@ -22,19 +34,101 @@ class RequestorType(Enum):
     consensus = "E"
 
 
+class NodesExhaustedError(Exception):
+    pass
+
+
+class NodeHealth:
+    """
+    Latency and error statistics of one node, with a circuit breaker: after
+    `REQUESTOR_BREAKER_THRESHOLD` consecutive failures the node is skipped for a
+    cooldown that doubles with every further failure.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.block_height: Optional[int] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @property
+    def error_rate(self) -> float:
+        total = self.successes + self.failures
+        return self.failures / total if total else 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.open_until
+
+    def record_success(self, duration: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        # exponentially weighted moving average
+        self.latency = (
+            duration if self.latency is None else 0.8 * self.latency + 0.2 * duration
+        )
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+        trips = self.consecutive_failures - REQUESTOR_BREAKER_THRESHOLD
+        if trips >= 0:
+            cooldown = REQUESTOR_BREAKER_COOLDOWN * 2 ** min(trips, 5)
+            self.open_until = time.monotonic() + cooldown
+            console.log(f"Node {self.name} skipped for {cooldown}s.")
+
+
+class NodePool:
+    """
+    The concordium-client nodes of one network, ranked by health.
+    """
+
+    def __init__(self, nodes: list[dict]):
+        self.nodes = [NodeHealth(x["host"], x["port"]) for x in nodes]
+        self.heights_checked_at = 0.0
+
+    def lagging(self, node: NodeHealth) -> bool:
+        heights = [x.block_height for x in self.nodes if x.block_height is not None]
+        if node.block_height is None or not heights:
+            return False
+        return max(heights) - node.block_height > REQUESTOR_MAX_BLOCK_LAG
+
+    def ranked(self) -> list[NodeHealth]:
+        """
+        Healthy nodes first, fastest first (nodes without a measurement yet get
+        a chance before slower ones). If every node is tripped or lagging, the
+        one whose breaker closes first is tried.
+        """
+        healthy = [x for x in self.nodes if x.available() and not self.lagging(x)]
+        if healthy:
+            return sorted(healthy, key=lambda x: (x.latency or 0.0, x.error_rate))
+        return sorted(self.nodes, key=lambda x: x.open_until)
+
+    def heights_stale(self) -> bool:
+        return (
+            time.monotonic() - self.heights_checked_at > REQUESTOR_HEIGHT_CHECK_INTERVAL
+        )
+
+
 class Requestor:
     """
     This class is performing the requests to concordium-client.
     """
 
     total_count = 0
-    failing_nodes = {}
     mainnet_nodes = GRPC_MAINNET
     testnet_nodes = GRPC_TESTNET
+    pools = {NET.MAINNET: NodePool(GRPC_MAINNET), NET.TESTNET: NodePool(GRPC_TESTNET)}
 
-    # failing_nodes = {k: 0 for k in nodes}
-
-    def request_failed(self, result):
+    def request_failed(self, result: CommandResult):
         if result.returncode == 1:
             return True
         else:
@@ -47,100 +141,136 @@ class Requestor:
                 return False
         # return result.returncode == 1
 
-    def __init__(self, args, net: NET, check_nodes=False, timeout=5):
+    def __init__(self, args, net: NET, timeout=CONCORDIUM_CLIENT_TIMEOUT):
         Requestor.total_count += 1
         self.net = net
-        if net == NET.MAINNET:
-            self.std_args = [
-                [
-                    f"{CONCORDIUM_CLIENT_PREFIX}concordium-client",
-                    "--grpc-retry",
-                    "3",
-                    "--grpc-ip",
-                    x["host"],
-                    "--grpc-port",
-                    str(x["port"]),
-                ]
-                for x in self.mainnet_nodes
-            ]
-        else:
-            self.std_args = [
-                [
-                    f"{CONCORDIUM_CLIENT_PREFIX}concordium-client",
-                    "--grpc-retry",
-                    "3",
-                    "--grpc-ip",
-                    x["host"],
-                    "--grpc-port",
-                    str(x["port"]),
-                ]
-                for x in self.testnet_nodes
-            ]
+        self.pool: NodePool = self.pools[net]
         self.timeout = timeout
         self.args = args
-        if not check_nodes:
-            self.ask_the_client_with_backup()
-        else:
-            self.check_nodes_with_heights()
 
-    def check_nodes(self):
+    def std_args(self, node: NodeHealth) -> list[str]:
+        return [
+            f"{CONCORDIUM_CLIENT_PREFIX}concordium-client",
+            "--grpc-retry",
+            "3",
+            "--grpc-ip",
+            node.host,
+            "--grpc-port",
+            str(node.port),
+        ]
+
+    async def check_nodes(self):
         results = {}
-        for arg in self.std_args:
-            arg.extend(["raw", "GetBlockInfo"])
-            result = subprocess.run(arg, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            results[arg[2]] = not self.request_failed(result)
+        for node in self.pool.nodes:
+            result = await run(
+                [*self.std_args(node), "raw", "GetBlockInfo"], timeout=self.timeout
+            )
+            results[node.name] = not self.request_failed(result)
         self.nodes_ok = results
 
-    def check_nodes_with_heights(self):
+    async def check_nodes_with_heights(self):
+        # mark first, so concurrent requests do not all start a check
+        self.pool.heights_checked_at = time.monotonic()
         results = {}
-        for arg in self.std_args:
-            arg.extend(["raw", "GetBlockInfo"])
-            result = subprocess.run(arg, stdout=subprocess.PIPE)
-            json_result = json.loads(result.stdout.decode("utf-8"))
-            results[arg[2]] = json_result["blockHeight"]
+        for node in self.pool.nodes:
+            try:
+                result = await run(
+                    [*self.std_args(node), "raw", "GetBlockInfo"],
+                    timeout=self.timeout,
+                )
+                json_result = json.loads(result.stdout.decode("utf-8"))
+                node.block_height = json_result["blockHeight"]
+            except Exception as e:
+                print(e)
+                node.record_failure()
+                node.block_height = None
+            results[node.name] = node.block_height
         self.nodes_ok = results
 
-    def ask_the_client_with_backup(self):
-        result = subprocess.CompletedProcess([], returncode=1)
-        node_index = 0
-        while self.request_failed(result):
-            len_nodes = (
-                len(self.mainnet_nodes)
-                if self.net == NET.MAINNET
-                else len(self.testnet_nodes)
-            )
-            if node_index == len_nodes:
-                node_index = 0
-                # time.sleep(0.001)
-            self.arguments = copy.deepcopy(self.std_args[node_index])
-            self.arguments.extend(self.args)
-            assert (len(self.arguments)) == (
-                len(self.std_args[node_index]) + len(self.args)
-            )
+    async def ask_the_client_with_backup(self) -> CommandResult:
+        """
+        Runs the request on the healthiest node, failing over to the next best
+        node on errors. Raises `NodesExhaustedError` once
+        `REQUESTOR_RETRY_BUDGET` attempts have failed.
+        """
+        if not self.pool.nodes:
+            raise NodesExhaustedError(f"{self.net.value}: no nodes configured.")
+        if len(self.pool.nodes) > 1 and self.pool.heights_stale():
+            await self.check_nodes_with_heights()
 
+        for attempt in range(REQUESTOR_RETRY_BUDGET):
+            if attempt > 0:
+                metrics.inc("node_failovers_total", net=self.net.value)
+            node = self.pool.ranked()[0]
+            self.arguments = [*self.std_args(node), *self.args]
             try:
-                result = subprocess.run(
-                    self.arguments, timeout=self.timeout, stdout=subprocess.PIPE
-                )
-                if self.request_failed(result):
-                    node_index += 1
-
+                result = await run(self.arguments, timeout=self.timeout)
             except Exception as e:
                 print(e)
-                node_index += 1
+                node.record_failure()
+                metrics.inc("node_failures_total", net=self.net.value, node=node.name)
+                continue
+
+            if self.request_failed(result):
+                node.record_failure()
+                metrics.inc("node_failures_total", net=self.net.value, node=node.name)
+                continue
+
+            node.record_success(result.duration)
+            self.result = result
+            return result
 
-        self.result = result
-        # if result.stdout.decode("utf-8") is None:
-        #     console.log(self.arguments, result.stdout)
+        raise NodesExhaustedError(
+            f"{self.net.value}: no node answered {self.args} in {REQUESTOR_RETRY_BUDGET} attempts."
+        )
+
+
+def decode_module_source(ms) -> tuple[int, bytes]:
+    """
+    Returns the Wasm version and the Wasm bytes of a `get_module_source` result.
+    """
+    if ms.v0:
+        return 0, bytes.fromhex(ms.v0)
+    else:
+        return 1, bytes.fromhex(ms.v1)
+
+
+def versioned_module(version: int, wasm: bytes) -> bytes:
+    """
+    Serializes a module the way `concordium-client module show --out` writes it
+    and `cargo concordium --module` reads it: a big-endian u32 version, a
+    big-endian u32 length and the Wasm bytes.
+    """
+    return struct.pack(">II", version, len(wasm)) + wasm
 
 
 class ConcordiumClient:
-    def __init__(self, tooter):
+    def __init__(self, tooter, grpcclient: Optional[AsyncGRPCClient] = None):
         self.tooter = tooter
+        self.grpcclient = grpcclient
 
-    def save_module(self, net: NET, module_ref: str):
-        result = Requestor(
-            ["module", "show", module_ref, "--out", f"tmp/{module_ref}.out"], net
-        ).result
+    async def save_module(self, net: NET, module_ref: str, out_path: str = None):
+        """
+        Writes the versioned module file for `module_ref` to `out_path`, straight
+        from the gRPC `GetModuleSource` response. `concordium-client module show`
+        is only used when that fails or no GRPCClient is available.
+        """
+        out_path = out_path or f"tmp/{module_ref}.out"
+        if self.grpcclient is not None:
+            try:
+                ms = await self.grpcclient.get_module_source(
+                    module_ref, "last_final", net
+                )
+                version, wasm = decode_module_source(ms)
+                with open(out_path, "wb") as file:
+                    file.write(versioned_module(version, wasm))
+                return out_path
+            except Exception as e:
+                console.log(
+                    f"{net.value}: gRPC download of {module_ref} failed with {e}, using concordium-client."
+                )
 
-        return result
+        await Requestor(
+            ["module", "show", module_ref, "--out", out_path], net
+        ).ask_the_client_with_backup()
+        return out_path
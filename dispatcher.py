@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from aiomqtt.client import Message
+from rich.console import Console
+
+console = Console()
+
+
+class TopicClass(Enum):
+    control = "control"
+    module_new = "module_new"
+    other = "other"
+
+
+def classify(message: Message) -> TopicClass:
+    if message.topic.matches("ccdexplorer/services/#"):
+        return TopicClass.control
+    if message.topic.matches("ccdexplorer/+/heartbeat/module/new"):
+        return TopicClass.module_new
+    return TopicClass.other
+
+
+class Dispatcher:
+    """
+    Hands incoming MQTT messages to a bounded pool of asyncio worker tasks,
+    so a slow verification no longer blocks the `async for` loop in main.py.
+
+    Every pooled topic class gets its own queue and a fixed number of workers.
+    Control topics bypass the pools and are started right away with `spawn`.
+    Work items that share a key (the module_ref) are run in the order in which
+    they were dispatched; items with different keys run concurrently. Within a
+    pool, items with a lower priority value (mainnet before testnet) go first.
+
+    A handler may return a coroutine as a follow-up (e.g. the verification of a
+    module). The follow-up runs in its own task, so the worker is free for the
+    next item right away, but later items with the same key still wait for it.
+    """
+
+    def __init__(self):
+        self.queues: dict[TopicClass, asyncio.PriorityQueue] = {}
+        self.workers: list[asyncio.Task] = []
+        self.tasks: set[asyncio.Task] = set()
+        # key -> future and priority of the most recently dispatched item for that key
+        self.tails: dict[str, tuple[asyncio.Future, int]] = {}
+        # tie-breaker, so items of the same priority keep their order
+        self.sequence = itertools.count()
+
+    def start(self, topic_class: TopicClass, workers: int):
+        queue = asyncio.PriorityQueue()
+        self.queues[topic_class] = queue
+        for index in range(max(1, workers)):
+            self.workers.append(
+                asyncio.create_task(
+                    self.worker(queue), name=f"{topic_class.value}-worker-{index}"
+                )
+            )
+
+    def dispatch(
+        self,
+        topic_class: TopicClass,
+        handler: Callable[[], Awaitable],
+        key: Optional[str] = None,
+        priority: int = 0,
+    ):
+        """
+        Queues `handler` on the pool for `topic_class`. Never blocks the caller.
+        """
+        previous = None
+        if key and key in self.tails:
+            previous, previous_priority = self.tails[key]
+            # never ahead of earlier work on the same key, which it waits for
+            priority = max(priority, previous_priority)
+        done = asyncio.get_running_loop().create_future()
+        if key:
+            self.tails[key] = (done, priority)
+        queue = self.queues[topic_class]
+        item = (priority, next(self.sequence), handler, key, done)
+        if previous is not None and not previous.done():
+            # queued once the earlier work is done, so no worker waits for it
+            previous.add_done_callback(lambda _: queue.put_nowait(item))
+        else:
+            queue.put_nowait(item)
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        """
+        Runs `coro` immediately in its own task, outside of the pools.
+        """
+        task = asyncio.create_task(self.guarded(coro))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def guarded(self, coro: Awaitable):
+        try:
+            return await coro
+        except Exception as e:
+            console.log(f"Dispatched task failed with error {e}.")
+
+    def finish(self, key: Optional[str], done: asyncio.Future):
+        done.set_result(None)
+        if key and key in self.tails and self.tails[key][0] is done:
+            del self.tails[key]
+
+    async def worker(self, queue: asyncio.PriorityQueue):
+        while True:
+            _, _, handler, key, done = await queue.get()
+            follow_up = None
+            try:
+                follow_up = await self.guarded(handler())
+            finally:
+                if asyncio.iscoroutine(follow_up):
+                    # the key stays taken until the follow-up is done
+                    task = self.spawn(follow_up)
+                    task.add_done_callback(
+                        lambda _, key=key, done=done: self.finish(key, done)
+                    )
+                else:
+                    self.finish(key, done)
+                queue.task_done()
+
+    def queue_depths(self) -> dict[str, int]:
+        return {
+            topic_class.value: queue.qsize()
+            for topic_class, queue in self.queues.items()
+        }
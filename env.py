@@ -25,3 +25,94 @@ if not os.environ.get("GRPC_TESTNET"):
     GRPC_TESTNET = []
 else:
     GRPC_TESTNET = ast.literal_eval(os.environ["GRPC_TESTNET"])
+
+# number of concurrent worker tasks for `heartbeat/module/new` messages
+DISPATCH_MODULE_NEW_TASKS = int(os.environ.get("DISPATCH_MODULE_NEW_TASKS", 4))
+
+# verification pipeline: workers per stage and the size of each stage queue
+VERIFY_DOWNLOAD_WORKERS = int(os.environ.get("VERIFY_DOWNLOAD_WORKERS", 2))
+VERIFY_BUILD_INFO_WORKERS = int(os.environ.get("VERIFY_BUILD_INFO_WORKERS", 2))
+VERIFY_SOURCE_WORKERS = int(os.environ.get("VERIFY_SOURCE_WORKERS", 2))
+VERIFY_BUILD_WORKERS = int(
+    os.environ.get("VERIFY_BUILD_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+)
+VERIFY_QUEUE_SIZE = int(os.environ.get("VERIFY_QUEUE_SIZE", 8))
+# share of the workers of each stage that may run backlog (cleanup) verifications at a time
+VERIFY_BACKLOG_SHARE = float(os.environ.get("VERIFY_BACKLOG_SHARE", 0.5))
+
+# external tool calls: timeouts in seconds and the captured output per stream in bytes
+CONCORDIUM_CLIENT_TIMEOUT = int(os.environ.get("CONCORDIUM_CLIENT_TIMEOUT", 5))
+PRINT_BUILD_INFO_TIMEOUT = int(os.environ.get("PRINT_BUILD_INFO_TIMEOUT", 60))
+VERIFY_BUILD_TIMEOUT = int(os.environ.get("VERIFY_BUILD_TIMEOUT", 1800))
+MAX_COMMAND_OUTPUT = int(os.environ.get("MAX_COMMAND_OUTPUT", 1024 * 1024))
+
+# part of the verification cache key; change it to invalidate all cached outcomes
+VERIFICATION_CACHE_VERSION = os.environ.get("VERIFICATION_CACHE_VERSION", "1")
+
+# on-disk store of module files, evicted least recently used first above the size budget
+MODULE_STORE_DIR = os.environ.get("MODULE_STORE_DIR", "tmp/modules")
+MODULE_STORE_MAX_BYTES = int(
+    os.environ.get("MODULE_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024)
+)
+
+# limits for source archives linked from the build info
+MAX_SOURCE_ARCHIVE_BYTES = int(
+    os.environ.get("MAX_SOURCE_ARCHIVE_BYTES", 100 * 1024 * 1024)
+)
+MAX_SOURCE_EXTRACTED_BYTES = int(
+    os.environ.get("MAX_SOURCE_EXTRACTED_BYTES", 500 * 1024 * 1024)
+)
+
+# shared HTTP client for source archive downloads
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 20))
+HTTP_PER_HOST_CONCURRENCY = int(os.environ.get("HTTP_PER_HOST_CONCURRENCY", 4))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", 1.0))
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", "tmp/http_cache")
+HTTP_CACHE_MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# number of documents per cleanup batch
+CLEANUP_BATCH_SIZE = int(os.environ.get("CLEANUP_BATCH_SIZE", 50))
+
+# write-behind buffer for MongoDB writes
+WRITE_BUFFER_MAX_OPS = int(os.environ.get("WRITE_BUFFER_MAX_OPS", 100))
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.environ.get("WRITE_BUFFER_FLUSH_INTERVAL", 2))
+
+# concordium-client node selection: attempts per request, circuit breaker and lag limits
+REQUESTOR_RETRY_BUDGET = int(os.environ.get("REQUESTOR_RETRY_BUDGET", 6))
+REQUESTOR_BREAKER_THRESHOLD = int(os.environ.get("REQUESTOR_BREAKER_THRESHOLD", 3))
+REQUESTOR_BREAKER_COOLDOWN = int(os.environ.get("REQUESTOR_BREAKER_COOLDOWN", 30))
+REQUESTOR_MAX_BLOCK_LAG = int(os.environ.get("REQUESTOR_MAX_BLOCK_LAG", 10))
+REQUESTOR_HEIGHT_CHECK_INTERVAL = int(
+    os.environ.get("REQUESTOR_HEIGHT_CHECK_INTERVAL", 60)
+)
+
+# async gRPC access: clients per network and the deadline per call in seconds
+GRPC_POOL_SIZE = int(os.environ.get("GRPC_POOL_SIZE", 4))
+GRPC_DEADLINE = float(os.environ.get("GRPC_DEADLINE", 30))
+
+# docker build images: images pulled at startup, disk budget and pull timeout in seconds
+BUILD_IMAGE_PREPULL_COUNT = int(os.environ.get("BUILD_IMAGE_PREPULL_COUNT", 3))
+BUILD_IMAGE_MAX_BYTES = int(
+    os.environ.get("BUILD_IMAGE_MAX_BYTES", 20 * 1024 * 1024 * 1024)
+)
+BUILD_IMAGE_PULL_TIMEOUT = int(os.environ.get("BUILD_IMAGE_PULL_TIMEOUT", 900))
+
+# verify-build mode: "isolated", or "shared_registry" to mount a cargo registry volume per build image
+VERIFY_BUILD_MODE = os.environ.get("VERIFY_BUILD_MODE", "isolated")
+VERIFY_CARGO_REGISTRY_PATH = os.environ.get(
+    "VERIFY_CARGO_REGISTRY_PATH", "/usr/local/cargo/registry"
+)
+
+# seconds a failed verification is not retried for the same module
+VERIFY_NEGATIVE_TTL = int(os.environ.get("VERIFY_NEGATIVE_TTL", 300))
+
+# verification leases on the modules documents: owner id (default hostname-pid) and lease duration in seconds
+REPLICA_ID = os.environ.get("REPLICA_ID", "")
+VERIFY_LEASE_TTL = int(os.environ.get("VERIFY_LEASE_TTL", 300))
+
+# MQTT shared subscription group for new modules; set it to split them over the replicas
+MQTT_SHARED_GROUP = os.environ.get("MQTT_SHARED_GROUP", "")
+
+# port of the /metrics HTTP endpoint; 0 disables it
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
@@ -3,21 +3,30 @@ import os
 import asyncio
 import atexit
 import json
+import signal
+import socket
 import subprocess
 import aiomqtt
 from aiomqtt.client import Message
 from ccdexplorer_fundamentals.GRPCClient import GRPCClient
-from ccdexplorer_fundamentals.mongodb import MongoMotor, Collections, ModuleVerification
+from ccdexplorer_fundamentals.mongodb import MongoMotor
 from ccdexplorer_fundamentals.tooter import Tooter
-from pymongo import DeleteOne, ReplaceOne
-from rich.progress import track
 from ccdexplorer_fundamentals.enums import NET
+from async_grpc import AsyncGRPCClient
 from concordium_client import ConcordiumClient
+from dispatcher import Dispatcher, TopicClass, classify
+from metrics import metrics
 from env import (
+    DISPATCH_MODULE_NEW_TASKS,
+    GRPC_DEADLINE,
+    GRPC_POOL_SIZE,
     MQTT_PASSWORD,
     MQTT_QOS,
     MQTT_SERVER,
+    MQTT_SHARED_GROUP,
     MQTT_USER,
+    METRICS_PORT,
+    REPLICA_ID,
     RUN_LOCAL,
     ADMIN_CHAT_ID,
 )
@@ -26,7 +35,6 @@ from subprocess import STDOUT, check_output
 
 tooter = Tooter()
 motormongo = MongoMotor(tooter, nearest=True)
-concordium_client = ConcordiumClient(tooter=tooter)
 # Suppress logging warnings
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 
@@ -34,7 +42,11 @@ os.environ["GRPC_VERBOSITY"] = "ERROR"
 def decode_to_json(msg: Message):
     m_decode = str(msg.payload.decode("utf-8", "ignore"))
     if len(m_decode) > 0:
-        m_in = json.loads(m_decode)  # decode json data
+        try:
+            m_in = json.loads(m_decode)  # decode json data
+        except json.JSONDecodeError:
+            print(f"Skipping {msg.topic.value}: payload is not JSON.")
+            m_in = ""
     else:
         m_in = ""
     return m_in
@@ -47,20 +59,6 @@ def filter_net(msg: Message) -> NET:
         return NET.MAINNET
 
 
-async def run(cmd: str):
-    proc = await asyncio.create_subprocess_shell(
-        cmd, stderr=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
-    )
-
-    stdout, stderr = await proc.communicate()
-
-    print(f"[{cmd!r} exited with {proc.returncode}]")
-    if stdout:
-        print(f"[stdout]\n{stdout.decode()}")
-    if stderr:
-        print(f"[stderr]\n{stderr.decode()}")
-
-
 def call_cmd(cmd):
     try:
         check_output(cmd, stderr=STDOUT, timeout=1, shell=True)
@@ -68,88 +66,187 @@ def call_cmd(cmd):
         print("Exit status 1")
 
 
+def handle_new_module(subscriber: Subscriber, net: NET, msg: dict):
+    async def handler():
+        context = await subscriber.process_new_module(net, msg)
+        # handed back to the dispatcher, so the worker does not wait for the build
+        return subscriber.verify_module(net, subscriber.concordium_client, msg, context)
+
+    return handler
+
+
+def reverify_request(msg) -> tuple[NET, str] | None:
+    """
+    The network and module_ref of a `services/module/reverify` payload, or None
+    if the payload is malformed.
+    """
+    if not isinstance(msg, dict) or not isinstance(msg.get("module_ref"), str):
+        return None
+    try:
+        return NET(msg.get("net", NET.MAINNET.value)), msg["module_ref"]
+    except (ValueError, TypeError):
+        return None
+
+
+def handle_reverify_module(subscriber: Subscriber, net: NET, module_ref: str):
+    async def handler():
+        await subscriber.verification_cache.invalidate(module_ref)
+        return subscriber.verify_module(
+            net,
+            subscriber.concordium_client,
+            {"module_ref": module_ref, "force_reverify": True},
+        )
+
+    return handler
+
+
+def net_priority(net: NET) -> int:
+    # mainnet before testnet
+    return 0 if net == NET.MAINNET else 1
+
+
+def stop_on_signals(task: asyncio.Task):
+    """
+    Cancels `task` on SIGTERM (`docker stop`) and SIGINT, so it can shut down
+    cleanly; `atexit` handlers do not run when the process is killed by a signal.
+    """
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+
+
+def mqtt_identifier() -> str:
+    """
+    The MQTT client id. It has to be unique per replica, as the broker drops
+    the older connection of a client id that connects twice.
+    """
+    if not REPLICA_ID and not MQTT_SHARED_GROUP:
+        return f"{RUN_LOCAL}module-mqtt-listener"
+    return f"{RUN_LOCAL}module-mqtt-listener-{REPLICA_ID or socket.gethostname()}"
+
+
+def mqtt_clean_session() -> bool:
+    """
+    A persistent session (`clean_session=False`) needs a client id that
+    survives a restart. The hostname fallback of a replica in a shared group
+    is the container id, which changes on every deploy; a persistent session
+    under it would stay behind on the broker and keep collecting messages.
+    """
+    return bool(MQTT_SHARED_GROUP) and not REPLICA_ID
+
+
+def module_new_subscription() -> str:
+    """
+    With `MQTT_SHARED_GROUP` set, the replicas of the group share one
+    subscription and the broker hands each new module message to one of them.
+    """
+    topic = "ccdexplorer/+/heartbeat/module/new"
+    if MQTT_SHARED_GROUP:
+        return f"$share/{MQTT_SHARED_GROUP}/{topic}"
+    return topic
+
+
 async def main():
     grpcclient = GRPCClient()
-    subscriber = Subscriber(grpcclient, tooter, motormongo, concordium_client)
+    async_grpcclient = AsyncGRPCClient(grpcclient, GRPC_POOL_SIZE, GRPC_DEADLINE)
+    concordium_client = ConcordiumClient(tooter=tooter, grpcclient=async_grpcclient)
+    subscriber = Subscriber(
+        grpcclient, tooter, motormongo, concordium_client, async_grpcclient
+    )
     atexit.register(subscriber.exit)
+    stop_on_signals(asyncio.current_task())
+    await subscriber.ensure_indexes()
+    subscriber.build_images.start()
+    # keep a reference, so the task is not garbage collected
+    reclaimer = asyncio.create_task(subscriber.reclaim_expired_leases())
 
     interval = 3
+    if mqtt_clean_session():
+        print(
+            "MQTT_SHARED_GROUP is set without REPLICA_ID: using a clean session, "
+            "so messages sent while this replica is down are not kept for it."
+        )
     client = aiomqtt.Client(
         MQTT_SERVER,
         1883,
         username=MQTT_USER,
         password=MQTT_PASSWORD,
-        clean_session=False,
-        identifier=f"{RUN_LOCAL}module-mqtt-listener",
+        clean_session=mqtt_clean_session(),
+        identifier=mqtt_identifier(),
     )
 
-    # for net in NET:
-    #     db_to_use = motormongo.mainnet if net == NET.MAINNET else motormongo.testnet
-    #     result = await db_to_use[Collections.modules].find({}).to_list(length=None)
-    #     for module in track(result):
-    #         if "verification" in module:
-    #             if module["verification"] is not None:
-    #                 if module["verification"]["verified"] is False:
-    #                     module["verification"].update(
-    #                         {"verification_status": "verified_failed"}
-    #                     )
-    #                 else:
-    #                     module["verification"].update(
-    #                         {"verification_status": "verified_success"}
-    #                     )
-    #             else:
-    #                 module.update(
-    #                     {
-    #                         "verification": ModuleVerification(
-    #                             verification_status="not_started"
-    #                         ).model_dump(exclude_none=True),
-    #                     }
-    #                 )
-    #         else:
-    #             module.update(
-    #                 {
-    #                     "verification": ModuleVerification(
-    #                         verification_status="not_started"
-    #                     ).model_dump(exclude_none=True),
-    #                 }
-    #             )
-
-    #         _ = await db_to_use[Collections.modules].bulk_write(
-    #             [ReplaceOne({"_id": module["_id"]}, module, upsert=True)]
-    #         )
-
-    # exit()
-    # msg = {
-    #     "module_ref": "98c0395109389123ea2f9370482ed8654487402f290361d2cf86a87d2065820f"
-    # }
-
-    # await subscriber.process_new_module(NET.TESTNET, msg)
-    # await subscriber.verify_module(NET.TESTNET, subscriber.concordium_client, msg)
-    await subscriber.cleanup("topic")
-    while True:
-        try:
-            async with client:
-                await client.subscribe("ccdexplorer/+/heartbeat/#", qos=MQTT_QOS)
-                await client.subscribe("ccdexplorer/services/#", qos=MQTT_QOS)
-                async for message in client.messages:
-                    net = filter_net(message)
-                    msg = decode_to_json(message)
-                    if message.topic.matches("ccdexplorer/services/module/restart"):
-                        exit()
-                    if message.topic.matches("ccdexplorer/services/cleanup"):
-                        await subscriber.cleanup("topic")
-                    if message.topic.matches("ccdexplorer/+/heartbeat/module/new"):
-                        await subscriber.process_new_module(net, msg)
-                        await subscriber.verify_module(
-                            net, subscriber.concordium_client, msg
-                        )
-                    if message.topic.matches("ccdexplorer/services/info"):
-                        await grpcclient.aconnection_info(
-                            "MS Modules", tooter, ADMIN_CHAT_ID
-                        )
-        except aiomqtt.MqttError:
-            print(f"Connection lost; Reconnecting in {interval} seconds ...")
-            await asyncio.sleep(interval)
+    dispatcher = Dispatcher()
+    dispatcher.start(TopicClass.module_new, DISPATCH_MODULE_NEW_TASKS)
+    metrics.gauge("dispatch_queue_depth", dispatcher.queue_depths)
+    if METRICS_PORT:
+        await metrics.serve(METRICS_PORT)
+    cleanup_task = None
+    try:
+        while True:
+            try:
+                async with client:
+                    await client.subscribe(module_new_subscription(), qos=MQTT_QOS)
+                    # control topics reach every replica
+                    await client.subscribe("ccdexplorer/services/#", qos=MQTT_QOS)
+                    # the startup cleanup runs next to live messages, once subscribed
+                    if cleanup_task is None:
+                        cleanup_task = dispatcher.spawn(subscriber.cleanup("startup"))
+                    async for message in client.messages:
+                        net = filter_net(message)
+                        msg = decode_to_json(message)
+                        topic_class = classify(message)
+                        if topic_class == TopicClass.control:
+                            if message.topic.matches(
+                                "ccdexplorer/services/module/restart"
+                            ):
+                                exit()
+                            if message.topic.matches("ccdexplorer/services/cleanup"):
+                                if cleanup_task is None or cleanup_task.done():
+                                    cleanup_task = dispatcher.spawn(
+                                        subscriber.cleanup("topic")
+                                    )
+                            if message.topic.matches(
+                                "ccdexplorer/services/module/reverify"
+                            ):
+                                request = reverify_request(msg)
+                                if request is None:
+                                    print(
+                                        f"Skipping malformed reverify request {msg!r}."
+                                    )
+                                else:
+                                    reverify_net, module_ref = request
+                                    dispatcher.dispatch(
+                                        TopicClass.module_new,
+                                        handle_reverify_module(
+                                            subscriber, reverify_net, module_ref
+                                        ),
+                                        key=module_ref,
+                                        priority=net_priority(reverify_net),
+                                    )
+                            if message.topic.matches("ccdexplorer/services/info"):
+                                dispatcher.spawn(
+                                    grpcclient.aconnection_info(
+                                        "MS Modules", tooter, ADMIN_CHAT_ID
+                                    )
+                                )
+                                subscriber.send_to_tooter(metrics.summary())
+                        if topic_class == TopicClass.module_new:
+                            if not isinstance(msg, dict) or "module_ref" not in msg:
+                                print(f"Skipping malformed new module message {msg!r}.")
+                                continue
+                            dispatcher.dispatch(
+                                TopicClass.module_new,
+                                handle_new_module(subscriber, net, msg),
+                                key=msg.get("module_ref"),
+                                priority=net_priority(net),
+                            )
+            except aiomqtt.MqttError:
+                print(f"Connection lost; Reconnecting in {interval} seconds ...")
+                await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        print("Stopping: storing buffered writes and releasing leases.")
+        reclaimer.cancel()
+        await subscriber.shutdown()
 
 
 asyncio.run(main())
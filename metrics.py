@@ -0,0 +1,150 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable
+
+from aiohttp import web
+from rich.console import Console
+
+console = Console()
+
+PREFIX = "ms_modules"
+# number of recent durations per span kept for the quantiles
+SPAN_WINDOW = 1024
+
+
+class Span:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent: deque[float] = deque(maxlen=SPAN_WINDOW)
+
+    def observe(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.recent.append(duration)
+
+    def quantile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """
+    In-process metrics: timing spans per stage, counters and gauges.
+
+    Spans are timed with `with metrics.span("verify_build"):`. Gauges are
+    callables registered once and read when the metrics are rendered, e.g. the
+    queue depths of the pipeline. `render` returns the Prometheus text format
+    served on `/metrics`; `summary` is a short text for `services/info`.
+    """
+
+    def __init__(self):
+        self.spans: dict[str, Span] = defaultdict(Span)
+        self.counters: dict[tuple[str, tuple], float] = defaultdict(float)
+        self.gauges: dict[str, Callable[[], dict[str, float]]] = {}
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.spans[stage].errors += 1
+            raise
+        finally:
+            self.spans[stage].observe(time.perf_counter() - start)
+
+    def observe(self, stage: str, duration: float):
+        self.spans[stage].observe(duration)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def gauge(self, name: str, read: Callable[[], dict[str, float]]):
+        """
+        Registers a gauge; `read` returns the current value per label value.
+        """
+        self.gauges[name] = read
+
+    def read_gauges(self) -> dict[str, dict[str, float]]:
+        values = {}
+        for name, read in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                console.log(f"Metrics: reading gauge {name} failed with error {e}.")
+        return values
+
+    def render(self) -> str:
+        lines = []
+        lines.append(f"# TYPE {PREFIX}_stage_seconds summary")
+        for stage, span in sorted(self.spans.items()):
+            for q in (0.5, 0.99):
+                lines.append(
+                    f'{PREFIX}_stage_seconds{{stage="{stage}",quantile="{q}"}} {span.quantile(q):.6f}'
+                )
+            lines.append(
+                f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {span.total:.6f}'
+            )
+            lines.append(
+                f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {span.count}'
+            )
+        lines.append(f"# TYPE {PREFIX}_stage_errors_total counter")
+        for stage, span in sorted(self.spans.items()):
+            lines.append(
+                f'{PREFIX}_stage_errors_total{{stage="{stage}"}} {span.errors}'
+            )
+        for (name, labels), value in sorted(self.counters.items()):
+            label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels)
+            lines.append(f"{PREFIX}_{name}{{{label_text}}} {value:g}")
+        for name, values in sorted(self.read_gauges().items()):
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            for label, value in sorted(values.items()):
+                lines.append(f'{PREFIX}_{name}{{name="{label}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        One line per stage (count, p50, p99, total time), then the gauges and counters.
+        """
+        lines = [f"MS Modules metrics, up {(time.time() - self.started) / 3600:.1f}h"]
+        for stage, span in sorted(
+            self.spans.items(), key=lambda item: item[1].total, reverse=True
+        ):
+            lines.append(
+                f"{stage}: {span.count}x, p50 {span.quantile(0.5):.2f}s, "
+                f"p99 {span.quantile(0.99):.2f}s, total {span.total / 60:.1f}min"
+                + (f", {span.errors} errors" if span.errors else "")
+            )
+        for name, values in sorted(self.read_gauges().items()):
+            lines.append(
+                f"{name}: " + ", ".join(f"{k}={v:g}" for k, v in sorted(values.items()))
+            )
+        for (name, labels), value in sorted(self.counters.items()):
+            label_text = ",".join(f"{value_}" for _, value_ in labels)
+            lines.append(f"{name}{f' ({label_text})' if label_text else ''}: {value:g}")
+        return "\n".join(lines)
+
+    async def serve(self, port: int) -> web.AppRunner:
+        """
+        Serves `render()` on `http://0.0.0.0:<port>/metrics`.
+        """
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        console.log(f"Metrics served on port {port}.")
+        return runner
+
+
+metrics = Metrics()
@@ -0,0 +1,132 @@
+import asyncio
+import datetime as dt
+import os
+import signal
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from rich.console import Console
+
+from env import MAX_COMMAND_OUTPUT
+
+console = Console()
+
+
+class CommandTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class CommandResult:
+    args: Union[list[str], str]
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    duration: float
+    truncated: bool = False
+
+    @property
+    def stdout_text(self) -> str:
+        return self.stdout.decode("utf-8", "ignore")
+
+    @property
+    def stderr_text(self) -> str:
+        return self.stderr.decode("utf-8", "ignore")
+
+
+async def capture(stream: asyncio.StreamReader, max_output: int) -> tuple[bytes, bool]:
+    """
+    Reads `stream` to the end, keeping only the last `max_output` bytes.
+    The tail is what matters for the tools we call (their verdict is printed last).
+    """
+    buffer = bytearray()
+    truncated = False
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_output:
+            del buffer[: len(buffer) - max_output]
+            truncated = True
+    return bytes(buffer), truncated
+
+
+def kill(proc: asyncio.subprocess.Process):
+    # the process leads its own session, so this also stops its children
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run(
+    cmd: Union[list[str], str],
+    timeout: Optional[float] = None,
+    cwd: Optional[str] = None,
+    env: Optional[dict] = None,
+    max_output: int = MAX_COMMAND_OUTPUT,
+) -> CommandResult:
+    """
+    Runs an external command without blocking the event loop.
+
+    `cmd` is either an argument list (executed directly) or a string (executed
+    through the shell). Stdout and stderr are captured up to `max_output` bytes
+    each. If the command runs longer than `timeout` seconds, or the awaiting
+    task is cancelled, the process and its children are killed; a timeout
+    raises `CommandTimeoutError`.
+    """
+    start = time.perf_counter()
+    if isinstance(cmd, str):
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            start_new_session=True,
+        )
+    else:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            start_new_session=True,
+        )
+
+    try:
+        (stdout, stdout_truncated), (stderr, stderr_truncated), _ = (
+            await asyncio.wait_for(
+                asyncio.gather(
+                    capture(proc.stdout, max_output),
+                    capture(proc.stderr, max_output),
+                    proc.wait(),
+                ),
+                timeout=timeout,
+            )
+        )
+    except asyncio.TimeoutError:
+        kill(proc)
+        await proc.wait()
+        console.log(f"[{cmd!r} killed after {timeout}s]")
+        raise CommandTimeoutError(f"{cmd!r} timed out after {timeout}s.")
+    except asyncio.CancelledError:
+        kill(proc)
+        await proc.wait()
+        raise
+
+    duration = time.perf_counter() - start
+    print(
+        f"{dt.datetime.now().astimezone(dt.UTC)}: [{cmd!r} exited with {proc.returncode} in {duration:.2f}s]"
+    )
+    return CommandResult(
+        args=cmd,
+        returncode=proc.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        duration=duration,
+        truncated=stdout_truncated or stderr_truncated,
+    )
@@ -16,5 +16,5 @@ done
 
 echo "Docker daemon started"
 
-# Run the python script
-python3 /home/code/main.py
\ No newline at end of file
+# Run the python script in place of this shell, so it receives the SIGTERM of `docker stop`
+exec python3 /home/code/main.py
\ No newline at end of file
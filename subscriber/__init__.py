@@ -1,3 +1,7 @@
+from typing import Optional
+
+from async_grpc import AsyncGRPCClient
+from ccdexplorer_fundamentals.enums import NET
 from ccdexplorer_fundamentals.GRPCClient import GRPCClient
 from ccdexplorer_fundamentals.mongodb import (
     Collections,
@@ -6,14 +10,52 @@ from ccdexplorer_fundamentals.mongodb import (
 )
 from ccdexplorer_fundamentals.tooter import Tooter
 from concordium_client import ConcordiumClient
+from env import (
+    BUILD_IMAGE_MAX_BYTES,
+    BUILD_IMAGE_PREPULL_COUNT,
+    BUILD_IMAGE_PULL_TIMEOUT,
+    GRPC_DEADLINE,
+    GRPC_POOL_SIZE,
+    HTTP_BACKOFF,
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_PER_HOST_CONCURRENCY,
+    HTTP_RETRIES,
+    MODULE_STORE_DIR,
+    MODULE_STORE_MAX_BYTES,
+    REPLICA_ID,
+    VERIFY_LEASE_TTL,
+    VERIFY_NEGATIVE_TTL,
+    WRITE_BUFFER_FLUSH_INTERVAL,
+    WRITE_BUFFER_MAX_OPS,
+)
+from metrics import metrics
+from pymongo import IndexModel
 from pymongo.collection import Collection
 from rich.console import Console
 
+from .build_images import BuildImageManager
+from .http_client import SourceHttpClient
+from .lease import VerificationLease, lease_owner
 from .module import Module as _module
+from .module_store import ModuleStore
+from .pipeline import Pipeline
+from .single_flight import SingleFlight
 from .utils import Utils as _utils
+from .verification_cache import VerificationCache
+from .write_buffer import WriteBuffer
 
 console = Console()
 
+# lookups of modules by name, contract or method
+MODULE_INDEXES = [
+    IndexModel("module_name"),
+    IndexModel("contract_names"),
+    IndexModel("methods"),
+    IndexModel("entrypoints"),
+]
+
 
 class Subscriber(_module, _utils):
     def __init__(
@@ -22,8 +64,12 @@ class Subscriber(_module, _utils):
         tooter: Tooter,
         motormongo: MongoMotor,
         concordium_client: ConcordiumClient,
+        async_grpcclient: Optional[AsyncGRPCClient] = None,
     ):
         self.grpcclient = grpcclient
+        self.async_grpcclient = async_grpcclient or AsyncGRPCClient(
+            grpcclient, GRPC_POOL_SIZE, GRPC_DEADLINE
+        )
         self.tooter = tooter
         self.motormongo = motormongo
         self.concordium_client = concordium_client
@@ -33,6 +79,65 @@ class Subscriber(_module, _utils):
         self.motor_utilities: dict[CollectionsUtilities, Collection] = (
             self.motormongo.utilities
         )
+        self.write_buffer = WriteBuffer(
+            {NET.MAINNET: self.motor_mainnet, NET.TESTNET: self.motor_testnet},
+            WRITE_BUFFER_MAX_OPS,
+            WRITE_BUFFER_FLUSH_INTERVAL,
+        )
+        self.module_store = ModuleStore(MODULE_STORE_DIR, MODULE_STORE_MAX_BYTES)
+        self.http_client = SourceHttpClient(
+            HTTP_CACHE_DIR,
+            HTTP_CACHE_MAX_BYTES,
+            HTTP_MAX_CONNECTIONS,
+            HTTP_PER_HOST_CONCURRENCY,
+            HTTP_RETRIES,
+            HTTP_BACKOFF,
+        )
+        self.build_images = BuildImageManager(
+            {NET.MAINNET: self.motor_mainnet, NET.TESTNET: self.motor_testnet},
+            BUILD_IMAGE_PREPULL_COUNT,
+            BUILD_IMAGE_MAX_BYTES,
+            BUILD_IMAGE_PULL_TIMEOUT,
+        )
+        self.verification_lease = VerificationLease(
+            {NET.MAINNET: self.motor_mainnet, NET.TESTNET: self.motor_testnet},
+            lease_owner(REPLICA_ID),
+            VERIFY_LEASE_TTL,
+        )
+        self.in_flight = SingleFlight(VERIFY_NEGATIVE_TTL)
+        self.verification_pipeline = Pipeline(self.verification_stages())
+        self.verification_cache = VerificationCache(
+            self.motormongo.utilities_db["modules_verification_cache"]
+        )
+        self.register_gauges()
+
+    def register_gauges(self):
+        metrics.gauge("pipeline_queue_depth", self.verification_pipeline.queue_depths)
+        metrics.gauge("pipeline_in_flight", self.verification_pipeline.in_flight)
+        metrics.gauge(
+            "modules_in_flight", lambda: {"modules": len(self.in_flight.in_flight)}
+        )
+        metrics.gauge(
+            "write_buffer_pending",
+            lambda: {"writes": self.write_buffer.pending_count()},
+        )
+
+    async def ensure_indexes(self):
+        await self.verification_cache.ensure_indexes()
+        await self.verification_lease.ensure_indexes()
+        for db in (self.motor_mainnet, self.motor_testnet):
+            await db[Collections.modules].create_indexes(MODULE_INDEXES)
+
+    async def shutdown(self):
+        """
+        Stores the buffered writes, then hands back the leases that are still
+        open; results written first have already replaced their leases. Closes
+        the pooled HTTP connections last.
+        """
+        await self.write_buffer.flush()
+        await self.verification_lease.release_all()
+        await self.http_client.aclose()
 
     def exit(self):
-        pass
+        self.write_buffer.flush_sync()
+        self.verification_lease.release_all_sync()
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from collections import defaultdict
+from typing import Optional
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo.collection import Collection
+from rich.console import Console
+from runner import run
+
+console = Console()
+SHIMS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "shims"
+)
+
+
+class BuildImageManager:
+    """
+    Keeps the Docker images used by `cargo concordium verify-build` warm.
+
+    The images are taken from `verification.build_image_used` on `modules`. At
+    startup the `prepull_count` most used images are pulled in the background,
+    and before every build the image of the module is pulled if it is missing,
+    so the pull is timed apart from the build. Only images seen here are
+    managed: once they take more than `max_bytes`, the least recently used ones
+    that are not in use by a build are removed, with their cargo registry volume.
+    All of this is best-effort: `ensure` and `evict` log Docker errors and
+    timeouts instead of raising, so they never decide a verification.
+    """
+
+    def __init__(
+        self,
+        dbs: dict[NET, dict[Collections, Collection]],
+        prepull_count: int,
+        max_bytes: int,
+        pull_timeout: float,
+    ):
+        self.dbs = dbs
+        self.prepull_count = prepull_count
+        self.max_bytes = max_bytes
+        self.pull_timeout = pull_timeout
+        # image -> last use (epoch seconds)
+        self.last_used: dict[str, float] = {}
+        self.in_use: dict[str, int] = defaultdict(int)
+        self.locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.warmer: Optional[asyncio.Task] = None
+        self.enabled = True
+
+    def start(self):
+        if self.warmer is None:
+            self.warmer = asyncio.create_task(self.warm())
+
+    async def popular_images(self) -> list[str]:
+        """
+        Returns the build images used on `modules`, most used first, and
+        records when each was last used.
+        """
+        counts: dict[str, int] = defaultdict(int)
+        pipeline = [
+            {"$match": {"verification.build_image_used": {"$type": "string"}}},
+            {
+                "$group": {
+                    "_id": "$verification.build_image_used",
+                    "count": {"$sum": 1},
+                    "last_used": {"$max": "$verification.verification_timestamp"},
+                }
+            },
+        ]
+        for db in self.dbs.values():
+            async for row in db[Collections.modules].aggregate(pipeline):
+                counts[row["_id"]] += row["count"]
+                if row.get("last_used") is not None:
+                    self.last_used[row["_id"]] = max(
+                        self.last_used.get(row["_id"], 0),
+                        row["last_used"].timestamp(),
+                    )
+        return sorted(counts, key=counts.get, reverse=True)
+
+    async def warm(self):
+        try:
+            images = await self.popular_images()
+        except Exception as e:
+            console.log(f"Build images: reading used images failed with error {e}.")
+            return
+        for image in images[: self.prepull_count]:
+            await self.ensure(image)
+            if not self.enabled:
+                return
+        await self.evict()
+
+    async def image_size(self, image: str) -> Optional[int]:
+        """
+        Returns the size of a local image, or None if it is not present.
+        Raises on other Docker failures, e.g. a timeout.
+        """
+        try:
+            result = await run(
+                ["docker", "image", "inspect", "--format", "{{.Size}}", image],
+                timeout=30,
+            )
+        except FileNotFoundError:
+            console.log("Build images: docker not found, image management disabled.")
+            self.enabled = False
+            return None
+        if result.returncode != 0:
+            return None
+        return int(result.stdout_text.strip())
+
+    async def ensure(self, image: str) -> Optional[float]:
+        """
+        Pulls `image` if it is not present. Returns the pull duration in
+        seconds, or None if no pull was needed (or it failed).
+        """
+        self.last_used[image] = max(self.last_used.get(image, 0), time.time())
+        if not self.enabled:
+            return None
+        async with self.locks[image]:
+            try:
+                if await self.image_size(image) is not None or not self.enabled:
+                    return None
+                result = await run(["docker", "pull", image], timeout=self.pull_timeout)
+            except Exception as e:
+                console.log(
+                    f"Build images: checking or pulling {image} failed with error {e}."
+                )
+                return None
+            if result.returncode != 0:
+                console.log(
+                    f"Build images: pulling {image} failed: {result.stderr_text.strip()}"
+                )
+                return None
+            console.log(f"Build images: pulled {image} in {result.duration:.1f}s.")
+            return result.duration
+
+    def acquire(self, image: str):
+        self.in_use[image] += 1
+        self.last_used[image] = time.time()
+
+    def release(self, image: str):
+        self.in_use[image] -= 1
+        self.last_used[image] = time.time()
+
+    def registry_volume(self, image: str) -> str:
+        return f"ccdexplorer-cargo-registry-{hashlib.sha256(image.encode()).hexdigest()[:16]}"
+
+    def shared_registry_env(self, image: str, registry_path: str) -> Optional[dict]:
+        """
+        Returns the environment for `verify-build` in the shared_registry mode:
+        the docker shim goes first on PATH and mounts the registry volume of
+        `image` at `registry_path` in the build container. Returns None if docker
+        is not found.
+        """
+        real_docker = shutil.which("docker")
+        if real_docker is None:
+            return None
+        return {
+            **os.environ,
+            "PATH": f"{SHIMS_DIR}{os.pathsep}{os.environ.get('PATH', '')}",
+            "REAL_DOCKER": real_docker,
+            "CARGO_REGISTRY_VOLUME": self.registry_volume(image),
+            "CARGO_REGISTRY_PATH": registry_path,
+        }
+
+    async def evict(self):
+        if not self.enabled:
+            return
+        sizes = {}
+        for image in list(self.last_used):
+            try:
+                size = await self.image_size(image)
+            except Exception as e:
+                console.log(f"Build images: inspecting {image} failed with error {e}.")
+                continue
+            if size is not None:
+                sizes[image] = size
+        total_bytes = sum(sizes.values())
+        for image in sorted(sizes, key=self.last_used.get):
+            if total_bytes <= self.max_bytes:
+                return
+            if self.in_use[image] > 0:
+                continue
+            size = sizes[image]
+            try:
+                result = await run(["docker", "rmi", image], timeout=60)
+                if result.returncode == 0:
+                    total_bytes -= size
+                    console.log(f"Build images: removed {image} ({size} bytes).")
+                    await run(
+                        ["docker", "volume", "rm", self.registry_volume(image)],
+                        timeout=60,
+                    )
+            except Exception as e:
+                console.log(f"Build images: removing {image} failed with error {e}.")
@@ -0,0 +1,22 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from ccdexplorer_fundamentals.enums import NET
+
+
+@dataclass
+class ModuleContext:
+    """
+    Everything learned about one module while handling a single message.
+    `process_new_module` fills it and `verify_module` picks it up, so the module
+    is fetched and parsed once per message.
+    """
+
+    net: NET
+    module_ref: str
+    version: Optional[int] = None
+    wasm: Optional[bytes] = None
+    exports: list[str] = field(default_factory=list)
+    module_path: Optional[str] = None
+    module_name: Optional[str] = None
+    methods: list[str] = field(default_factory=list)
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+from rich.console import Console
+
+console = Console()
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SourceTooLargeError(Exception):
+    pass
+
+
+class SourceHttpClient:
+    """
+    Long-lived HTTP client for source archive downloads.
+
+    One pooled `httpx.AsyncClient` (HTTP/2, keep-alive) is shared by all
+    downloads, with a cap on concurrent downloads per host. Failed requests
+    (connection errors and 429/5xx responses) are retried with exponential
+    backoff. Responses that carry an `ETag` or `Last-Modified` header are kept
+    in a local response cache and revalidated with a conditional request, so an
+    unchanged archive is not transferred again. File I/O runs in a thread, so
+    large archives do not stall the event loop.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        cache_max_bytes: int,
+        max_connections: int,
+        per_host: int,
+        retries: int,
+        backoff: float,
+    ):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(60, connect=10),
+        )
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_max_bytes = cache_max_bytes
+        self.per_host = per_host
+        self.host_limits: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.per_host)
+        )
+        self.retries = retries
+        self.backoff = backoff
+
+    def cache_paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        meta_path, body_path = self.cache_paths(url)
+        if not (meta_path.exists() and body_path.exists()):
+            return {}
+        meta = json.loads(meta_path.read_text())
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    async def download(self, url: str, path: str, max_bytes: int) -> int:
+        """
+        Streams `url` to `path` and returns the number of bytes written.
+        Raises `SourceTooLargeError` above `max_bytes`, and `httpx.HTTPError`
+        when the download still fails after all retries.
+        """
+        host = httpx.URL(url).host
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.host_limits[host]:
+                    return await self.fetch(url, path, max_bytes)
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                retryable = isinstance(exc, httpx.TransportError) or (
+                    exc.response.status_code in RETRY_STATUS_CODES
+                )
+                if not retryable or attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                console.log(f"{url}: {exc}, retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+
+    async def fetch(self, url: str, path: str, max_bytes: int) -> int:
+        headers = await asyncio.to_thread(self.conditional_headers, url)
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                return await asyncio.to_thread(self.reuse, url, path, max_bytes)
+
+            response.raise_for_status()
+            size = 0
+            file = await asyncio.to_thread(open, path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise SourceTooLargeError(
+                            f"Source archive is larger than {max_bytes} bytes."
+                        )
+                    await asyncio.to_thread(file.write, chunk)
+            finally:
+                await asyncio.to_thread(file.close)
+
+            etag = response.headers.get("etag")
+            last_modified = response.headers.get("last-modified")
+        if etag or last_modified:
+            await asyncio.to_thread(self.store, url, path, etag, last_modified)
+        return size
+
+    def reuse(self, url: str, path: str, max_bytes: int) -> int:
+        _, body_path = self.cache_paths(url)
+        size = body_path.stat().st_size
+        if size > max_bytes:
+            raise SourceTooLargeError(
+                f"Source archive is larger than {max_bytes} bytes."
+            )
+        shutil.copyfile(body_path, path)
+        os.utime(body_path)
+        return size
+
+    def store(self, url: str, path: str, etag: str, last_modified: str):
+        meta_path, body_path = self.cache_paths(url)
+        partial = body_path.with_suffix(".partial")
+        shutil.copyfile(path, partial)
+        os.replace(partial, body_path)
+        meta_path.write_text(
+            json.dumps({"url": url, "etag": etag, "last_modified": last_modified})
+        )
+        self.evict()
+
+    def evict(self):
+        bodies = []
+        for body in self.cache_dir.glob("*.body"):
+            try:
+                stat = body.stat()
+            except FileNotFoundError:
+                # removed by an eviction running in another thread
+                continue
+            bodies.append((stat.st_mtime, stat.st_size, body))
+        bodies.sort()
+        total = sum(size for _, size, _ in bodies)
+        for _, size, body in bodies[:-1]:
+            if total <= self.cache_max_bytes:
+                break
+            total -= size
+            body.unlink(missing_ok=True)
+            body.with_suffix(".json").unlink(missing_ok=True)
+
+    async def aclose(self):
+        await self.client.aclose()
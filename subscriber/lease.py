@@ -0,0 +1,160 @@
+import asyncio
+import datetime as dt
+import os
+import socket
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.mongodb import Collections
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from rich.console import Console
+
+console = Console()
+
+# finding expired leases without a collection scan
+LEASE_INDEXES = [
+    IndexModel("verification.lease_expires", sparse=True),
+]
+
+# the verification status and result are left as they are
+RELEASE_UPDATE = {
+    "$unset": {"verification.lease_owner": "", "verification.lease_expires": ""},
+}
+
+
+def lease_owner(replica_id: Optional[str] = None) -> str:
+    return replica_id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class VerificationLease:
+    """
+    Claims modules for verification on the `modules` document itself.
+
+    A claim sets `verification.lease_owner` and `verification.lease_expires`
+    in a single `find_one_and_update`, so of several replicas only one builds
+    a module. The status and result of an earlier verification are left as
+    they are, so a module being verified again keeps its verdict until the
+    new one is stored, and a release only removes the lease fields. The lease
+    is renewed every `ttl / 3` seconds while the verification runs and ends
+    when the result replaces `verification`. A lease that expired (its owner
+    crashed) can be claimed again, see `expired_query`.
+    """
+
+    def __init__(
+        self, dbs: dict[NET, dict[Collections, Collection]], owner: str, ttl: float
+    ):
+        self.dbs = dbs
+        self.owner = owner
+        self.ttl = ttl
+
+    def now(self) -> dt.datetime:
+        return dt.datetime.now().astimezone(dt.UTC)
+
+    def expired_query(self) -> dict:
+        return {"verification.lease_expires": {"$lt": self.now()}}
+
+    async def ensure_indexes(self):
+        for db in self.dbs.values():
+            await db[Collections.modules].create_indexes(LEASE_INDEXES)
+
+    async def claim(self, net: NET, module_ref: str) -> bool:
+        """
+        Claims the module unless another owner holds a lease that has not
+        expired. A module without a document is not shared, so it counts as claimed.
+        """
+        now = self.now()
+        collection = self.dbs[net][Collections.modules]
+        claimed = await collection.find_one_and_update(
+            {
+                "_id": module_ref,
+                "$or": [
+                    {"verification.lease_expires": {"$exists": False}},
+                    {"verification.lease_expires": {"$lt": now}},
+                    {"verification.lease_owner": self.owner},
+                ],
+            },
+            {
+                "$set": {
+                    "verification.lease_owner": self.owner,
+                    "verification.lease_expires": now + dt.timedelta(seconds=self.ttl),
+                }
+            },
+            projection={"_id": 1},
+        )
+        if claimed is not None:
+            return True
+        return await collection.count_documents({"_id": module_ref}, limit=1) == 0
+
+    async def renew(self, net: NET, module_ref: str):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.dbs[net][Collections.modules].update_one(
+                    {"_id": module_ref, "verification.lease_owner": self.owner},
+                    {
+                        "$set": {
+                            "verification.lease_expires": self.now()
+                            + dt.timedelta(seconds=self.ttl)
+                        }
+                    },
+                )
+            except Exception as e:
+                console.log(f"{module_ref}: renewing lease failed with error {e}.")
+
+    def release_filter(self, module_ref: Optional[str] = None) -> dict:
+        query = {"verification.lease_owner": self.owner}
+        if module_ref is not None:
+            query["_id"] = module_ref
+        return query
+
+    async def release(self, net: NET, module_ref: str):
+        """
+        Hands back a lease that did not end with a result, e.g. when the
+        verification raised; a stored result has already replaced it.
+        """
+        await self.dbs[net][Collections.modules].update_one(
+            self.release_filter(module_ref), RELEASE_UPDATE
+        )
+
+    @asynccontextmanager
+    async def hold(self, net: NET, module_ref: str):
+        """
+        Claims the module and renews the lease until the block ends. Yields
+        whether the claim succeeded.
+        """
+        if not await self.claim(net, module_ref):
+            yield False
+            return
+        renewer = asyncio.create_task(self.renew(net, module_ref))
+        try:
+            yield True
+        except BaseException:
+            await self.release(net, module_ref)
+            raise
+        finally:
+            renewer.cancel()
+
+    async def release_all(self):
+        """
+        Hands back all leases of this owner that are still open, on shutdown.
+        """
+        for db in self.dbs.values():
+            result = await db[Collections.modules].update_many(
+                self.release_filter(), RELEASE_UPDATE
+            )
+            if result.modified_count:
+                console.log(f"Released {result.modified_count} verification leases.")
+
+    def release_all_sync(self):
+        """
+        Hands back all leases of this owner that are still open, with the
+        synchronous driver, for use from `atexit`.
+        """
+        for db in self.dbs.values():
+            result = db[Collections.modules].delegate.update_many(
+                self.release_filter(), RELEASE_UPDATE
+            )
+            if result.modified_count:
+                console.log(f"Released {result.modified_count} verification leases.")
@@ -1,6 +1,5 @@
-import io
+import asyncio
 
-import ccdexplorer_fundamentals.GRPCClient.wadze as wadze
 from ccdexplorer_fundamentals.enums import NET
 from ccdexplorer_fundamentals.GRPCClient import GRPCClient
 import re
@@ -9,21 +8,76 @@ from ccdexplorer_fundamentals.mongodb import (
 )
 from ccdexplorer_fundamentals.tooter import Tooter
 from ccdexplorer_fundamentals.mongodb import ModuleVerification
-from pymongo import DeleteOne, ReplaceOne
 from pymongo.collection import Collection
-from concordium_client import ConcordiumClient
+from typing import Optional
+from async_grpc import AsyncGRPCClient
+from concordium_client import ConcordiumClient, decode_module_source
 from rich.console import Console
-import subprocess
 import httpx
 import os
 import shutil
 import datetime as dt
 import tarfile
-from pathlib import Path
+from metrics import metrics
+from runner import CommandResult, run
+
+from env import (
+    CLEANUP_BATCH_SIZE,
+    MAX_SOURCE_ARCHIVE_BYTES,
+    MAX_SOURCE_EXTRACTED_BYTES,
+    PRINT_BUILD_INFO_TIMEOUT,
+    VERIFY_BACKLOG_SHARE,
+    VERIFY_BUILD_INFO_WORKERS,
+    VERIFY_BUILD_MODE,
+    VERIFY_BUILD_TIMEOUT,
+    VERIFY_BUILD_WORKERS,
+    VERIFY_CARGO_REGISTRY_PATH,
+    VERIFY_DOWNLOAD_WORKERS,
+    VERIFY_QUEUE_SIZE,
+    VERIFY_SOURCE_WORKERS,
+)
 
+from .build_images import BuildImageManager
+from .context import ModuleContext
+from .http_client import SourceHttpClient, SourceTooLargeError
+from .lease import VerificationLease
+from .module_store import ModuleStore
+from .pipeline import Pipeline, Stage, VerificationJob
+from .single_flight import SingleFlight
 from .utils import Utils as _utils
+from .wasm import (
+    WasmParseError,
+    build_info,
+    embedded_schema,
+    exported_functions,
+    module_metadata,
+    receive_methods,
+)
+from .write_buffer import WriteBuffer
 
 console = Console()
+ANSI_ESCAPE = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+
+
+async def batches(
+    collection: Collection, query: dict, projection: dict, size: int, after=None
+):
+    """
+    Yields the documents matching `query` in pages of `size`, ordered by `_id`,
+    starting after the `_id` `after` if given. Every page is a fresh query after
+    the last `_id` seen, so no server cursor is kept open while a page is being
+    processed.
+    """
+    last_id = after
+    while True:
+        page_query = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        batch = await collection.find(
+            page_query, projection=projection, sort=[("_id", 1)], limit=size
+        ).to_list(length=size)
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]["_id"]
 
 
 class Module(_utils):
@@ -31,62 +85,102 @@ class Module(_utils):
     def get_project_root(self):
         return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-    def get_module_metadata(
-        self, net: NET, block_hash: str, module_ref: str
+    async def get_module_metadata(
+        self,
+        net: NET,
+        block_hash: str,
+        module_ref: str,
+        context: Optional[ModuleContext] = None,
     ) -> dict[str, str]:
         """
-        Retrieves metadata for a specified module. Parses the web assembly source code.
+        Retrieves metadata for a specified module. Reads the exported functions from
+        the export section of the web assembly module and the embedded schema from
+        its custom sections; other sections are skipped.
 
         Args:
             net (NET): The network from which to retrieve the module.
             block_hash (str): The hash of the block containing the module.
             module_ref (str): The reference identifier for the module.
+            context (ModuleContext, optional): Receives the module bytes, the exported
+                functions, the path of the stored module file and the metadata.
 
         Returns:
             dict[str, str]: A dictionary containing the module's metadata. The keys include:
                 - "module_name": The name of the module (if found).
                 - "methods": A list of method names exported by the module (if any).
+                - "contract_names": The names of the contracts in the module.
+                - "receive_methods": The receive methods per contract.
+                - "entrypoints": The receive functions as `contract.method`.
+                - "schema_section" and "schema": The name and hex contents of the
+                    embedded schema section (if any).
+                - "module_size": The size of the Wasm module in bytes.
+                - "wasm_version": The Wasm version of the module.
 
         Raises:
             Exception: If there is an error parsing the module, an error message is sent to the tooter and an empty dictionary is returned.
         """
-        self.grpcclient: GRPCClient
-        ms = self.grpcclient.get_module_source(module_ref, block_hash, net)
+        self.async_grpcclient: AsyncGRPCClient
+        self.module_store: ModuleStore
+
+        context = context or ModuleContext(net, module_ref)
 
-        if ms.v0:
-            bs = io.BytesIO(bytes.fromhex(ms.v0))
+        source = self.module_store.get_source(module_ref)
+        if source is None:
+            with metrics.span("grpc_fetch"):
+                ms = await self.async_grpcclient.get_module_source(
+                    module_ref, block_hash, net
+                )
+            version, wasm = decode_module_source(ms)
+            self.module_store.put_source(module_ref, version, wasm)
         else:
-            bs = io.BytesIO(bytes.fromhex(ms.v1))
+            version, wasm = source
+        context.version = version
+        context.wasm = wasm
+        context.module_path = str(self.module_store.path(module_ref))
 
         try:
-            module = wadze.parse_module(bs.read())
-        except Exception as e:
+            with metrics.span("parse"):
+                function_names = exported_functions(wasm)
+                schema = embedded_schema(wasm)
+        except (WasmParseError, UnicodeDecodeError) as e:
             tooter_message = (
                 f"{net.value}: New module get_module_metadata failed with error  {e}."
             )
             self.send_to_tooter(tooter_message)
             return {}
 
-        results = {}
-        if "export" in module.keys():
-            for line in module["export"]:
-                split_line = str(line).split("(")
-                if split_line[0] == "ExportFunction":
-                    split_line = str(line).split("'")
-                    name = split_line[1]
-
-                    if name[:5] == "init_":
-                        results["module_name"] = name[5:]
-                    else:
-                        method_name = name.split(".")[1] if "." in name else name
-                        if "methods" in results:
-                            results["methods"].append(method_name)
-                        else:
-                            results["methods"] = [method_name]
-
+        results = module_metadata(function_names)
+        methods_per_contract = receive_methods(function_names)
+        results.update(
+            {
+                "contract_names": list(methods_per_contract),
+                "receive_methods": methods_per_contract,
+                "entrypoints": [
+                    f"{contract}.{method}"
+                    for contract, methods in methods_per_contract.items()
+                    for method in methods
+                ],
+                "schema_section": schema[0] if schema else None,
+                "schema": schema[1].hex() if schema else None,
+                "module_size": len(wasm),
+                "wasm_version": version,
+            }
+        )
+        context.exports = function_names
+        context.module_name = results.get("module_name")
+        context.methods = results.get("methods", [])
         return results
 
     async def cleanup(self, from_: str):
+        """
+        Picks up modules that were missed while the service was down: modules on
+        `queue_todo` are processed and verified, and modules that were never
+        verified, or whose verification lease expired, are verified. Both collections are read in pages of
+        `CLEANUP_BATCH_SIZE`; the modules of a page are handled concurrently and the
+        processed `queue_todo` entries are removed with one bulk write per page.
+        """
+        self.write_buffer: WriteBuffer
+        self.verification_lease: VerificationLease
 
         for net in NET:
             console.log(f"Running cleanup for {net} from {from_}.")
@@ -94,337 +188,623 @@ class Module(_utils):
                 self.motor_mainnet if net == NET.MAINNET else self.motor_testnet
             )
 
-            todo_modules = (
-                await db[Collections.queue_todo]
-                .find({"type": "module"})
-                .to_list(length=None)
-            )
-            for msg in todo_modules:
-                await self.process_new_module(net, msg)
-                await self.remove_todo_from_queue(net, msg)
-                await self.verify_module(net, self.concordium_client, msg)
-
-            # specials for non verified modules
-            todo_modules = (
-                await db[Collections.modules]
-                .find({"verification.verification_status": "not_started"})
-                .to_list(length=None)
-            )
-            for msg in todo_modules:
-                await self.verify_module(net, self.concordium_client, msg)
+            async for batch in batches(
+                db[Collections.queue_todo],
+                {"type": "module"},
+                {"_id": 1, "module_ref": 1},
+                CLEANUP_BATCH_SIZE,
+            ):
+                await self.run_batch(
+                    [
+                        self.process_and_verify_module(net, msg, backlog=True)
+                        for msg in batch
+                    ]
+                )
+                await self.remove_todos_from_queue(net, batch)
+
+            # specials for non verified modules; write pending results first,
+            # so modules verified above are not picked up again
+            await self.write_buffer.flush(net)
+            async for batch in batches(
+                db[Collections.modules],
+                {
+                    "$or": [
+                        {"verification.verification_status": "not_started"},
+                        self.verification_lease.expired_query(),
+                    ]
+                },
+                {"_id": 1, "module_name": 1},
+                CLEANUP_BATCH_SIZE,
+            ):
+                await self.run_batch(
+                    [
+                        self.verify_module(
+                            net, self.concordium_client, msg, backlog=True
+                        )
+                        for msg in batch
+                    ]
+                )
 
-    async def remove_todo_from_queue(self, net: NET, msg: dict):
-        db: dict[Collections, Collection] = (
-            self.motor_mainnet if net == NET.MAINNET else self.motor_testnet
-        )
+    async def reclaim_expired_leases(self):
+        """
+        Every lease period, verifies the modules whose verification lease expired
+        because their owner stopped without handing it back.
+        """
+        self.verification_lease: VerificationLease
+
+        while True:
+            await asyncio.sleep(self.verification_lease.ttl)
+            for net in NET:
+                db: dict[Collections, Collection] = (
+                    self.motor_mainnet if net == NET.MAINNET else self.motor_testnet
+                )
+                try:
+                    async for batch in batches(
+                        db[Collections.modules],
+                        self.verification_lease.expired_query(),
+                        {"_id": 1, "module_name": 1},
+                        CLEANUP_BATCH_SIZE,
+                    ):
+                        console.log(
+                            f"{net.value}: reclaiming {len(batch)} expired verification leases."
+                        )
+                        await self.run_batch(
+                            [
+                                self.verify_module(
+                                    net, self.concordium_client, msg, backlog=True
+                                )
+                                for msg in batch
+                            ]
+                        )
+                except Exception as e:
+                    console.log(f"Reclaiming expired leases failed with error {e}.")
+
+    async def run_batch(self, coros: list):
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                console.log(f"Cleanup item failed with error {result}.")
 
-        _ = await db[Collections.queue_todo].bulk_write(
-            [DeleteOne({"_id": msg["_id"]})]
+    async def process_and_verify_module(
+        self, net: NET, msg: dict, backlog: bool = False
+    ):
+        context = await self.process_new_module(net, msg)
+        await self.verify_module(
+            net, self.concordium_client, msg, context, backlog=backlog
         )
 
-    async def process_new_module(self, net: NET, msg: dict):
+    async def remove_todos_from_queue(self, net: NET, msgs: list[dict]):
+        self.write_buffer: WriteBuffer
+
+        for msg in msgs:
+            await self.write_buffer.delete(net, Collections.queue_todo, msg["_id"])
+
+    async def process_new_module(self, net: NET, msg: dict) -> ModuleContext:
         """
         Processes a new module by fetching its metadata and updating the database.
         Args:
             net (NET): The network type (MAINNET or TESTNET).
             msg (dict): The message containing the module reference.
         Returns:
-            None
+            ModuleContext: The fetched module, to be handed to `verify_module`.
         Raises:
             Exception: If there is an error while fetching module metadata.
         The function performs the following steps:
-        1. Determines the database to use based on the network type.
-        2. Fetches the module metadata using the provided module reference.
-        3. If an error occurs during metadata fetching, sends an error message to the tooter.
-        4. Constructs a module dictionary with the fetched metadata.
-        5. Updates the database with the new module information using a bulk write operation.
-        6. Sends a success message to the tooter with the module reference and name.
+        1. Fetches the module metadata using the provided module reference.
+        2. If an error occurs during metadata fetching, sends an error message to the tooter.
+        3. Constructs a module dictionary with the fetched metadata.
+        4. Buffers a replacement of the module document in the write buffer.
+        5. Sends a success message to the tooter with the module reference and name.
         """
 
-        self.motor_mainnet: dict[Collections, Collection]
-        self.motor_testnet: dict[Collections, Collection]
+        self.in_flight: SingleFlight
+
+        module_ref = msg["module_ref"]
+        return await self.in_flight.run(
+            ("process", net, module_ref),
+            lambda: self.store_new_module(net, module_ref),
+        )
+
+    async def store_new_module(self, net: NET, module_ref: str) -> ModuleContext:
         self.grpcclient: GRPCClient
         self.tooter: Tooter
+        self.write_buffer: WriteBuffer
 
-        db_to_use = self.motor_mainnet if net == NET.MAINNET else self.motor_testnet
-        module_ref = msg["module_ref"]
+        context = ModuleContext(net, module_ref)
         try:
-            results = self.get_module_metadata(net, "last_final", module_ref)
+            results = await self.get_module_metadata(
+                net, "last_final", module_ref, context
+            )
         except Exception as e:
             tooter_message = f"{net.value}: New module failed with error  {e}."
             self.send_to_tooter(tooter_message)
-            return
+            return context
 
         module = {
             "_id": module_ref,
-            "module_name": (
-                results["module_name"] if "module_name" in results.keys() else None
-            ),
-            "methods": results["methods"] if "methods" in results.keys() else [],
+            **self.metadata_fields(results),
             "verification": ModuleVerification(
                 verification_status="not_started"
             ).model_dump(exclude_none=True),
         }
 
-        _ = await db_to_use[Collections.modules].bulk_write(
-            [ReplaceOne({"_id": module_ref}, module, upsert=True)]
-        )
+        await self.write_buffer.replace(net, Collections.modules, module)
         tooter_message = f"{net.value}: New module processed {module_ref} with name {module['module_name']}."
         self.send_to_tooter(tooter_message)
+        return context
+
+    def metadata_fields(self, results: dict) -> dict:
+        """
+        The fields of the `modules` document taken from `get_module_metadata`.
+        """
+        return {
+            "module_name": (
+                results["module_name"] if "module_name" in results.keys() else None
+            ),
+            "methods": results["methods"] if "methods" in results.keys() else [],
+            "contract_names": results.get("contract_names", []),
+            "receive_methods": results.get("receive_methods", {}),
+            "entrypoints": results.get("entrypoints", []),
+            "schema_section": results.get("schema_section"),
+            "schema": results.get("schema"),
+            "module_size": results.get("module_size"),
+            "wasm_version": results.get("wasm_version"),
+        }
+
+    async def refresh_module_metadata(self, net: NET, module_ref: str) -> ModuleContext:
+        """
+        Extracts the metadata of an existing module again and updates its fields on
+        the `modules` document, leaving the verification as it is.
+        """
+        self.write_buffer: WriteBuffer
+
+        context = ModuleContext(net, module_ref)
+        results = await self.get_module_metadata(net, "last_final", module_ref, context)
+        if results:
+            await self.write_buffer.set(
+                net, Collections.modules, module_ref, self.metadata_fields(results)
+            )
+        return context
 
     async def verify_module(
-        self, net: NET, concordium_client: ConcordiumClient, msg: dict
+        self,
+        net: NET,
+        concordium_client: ConcordiumClient,
+        msg: dict,
+        context: Optional[ModuleContext] = None,
+        backlog: bool = False,
+        notify: bool = True,
     ):
         """
         Verifies a module by checking its build information and source code.
-        This asynchronous method performs the following steps:
-        1. Determines the appropriate database to use based on the network (mainnet or testnet).
-        2. Saves the module using the Concordium client.
-        3. Runs a subprocess to print the build information of the module.
-        4. Parses the build information to extract the build image, build command, and archive hash.
-        5. Checks if the source code link is present in the build information.
-        6. If the source code link is present, retrieves the source code from the link.
-        7. Extracts the source code and verifies it against the module using a subprocess.
-        8. Saves and sends the verification result.
+        The work is handed to the verification pipeline, which runs these stages,
+        each with its own queue and pool of workers:
+        1. `download`: saves the module file (over gRPC, with the Concordium client as fallback).
+        2. `build_info`: reads the build image, build command, archive hash and source
+            code link from the module's build info section.
+        3. `source`: retrieves the source code from the link and extracts it.
+        4. `verify_build`: verifies the source code against the module using a subprocess.
+        The resulting verification is then saved and sent.
+        Concurrent calls for the same module share one verification, and a module
+        that failed less than `VERIFY_NEGATIVE_TTL` seconds ago is not verified again
+        unless the message asks for `force_reverify`.
         Args:
             net (NET): The network type (mainnet or testnet).
             concordium_client (ConcordiumClient): The Concordium client used to interact with the blockchain.
-            msg (dict): The message containing the module reference.
+            msg (dict): The message containing the module reference. If it contains
+                `force_reverify: True`, a cached verification result is not reused.
+            context (ModuleContext, optional): The module as fetched by `process_new_module`.
+            backlog (bool, optional): Backlog work (cleanup, lease reclaims), which
+                the pipeline runs after live modules, on a share of its workers.
+            notify (bool, optional): Whether to send the verification result to the tooter.
         Returns:
             None: This method does not return any value. It performs actions and sends the verification result.
-        Raises:
-            httpx.HTTPError: If there is an HTTP error while retrieving the source code.
-            Exception: If there is an error during the extraction or verification process.
         """
-        self.motor_mainnet: dict[Collections, Collection]
-        self.motor_testnet: dict[Collections, Collection]
-        self.tooter: Tooter
+        self.in_flight: SingleFlight
 
         if "module_ref" in msg:
             module_ref = msg["module_ref"]
         else:
             module_ref = msg["_id"]
+        force = msg.get("force_reverify", False)
+        module_name = context.module_name if context else msg.get("module_name")
+
+        key = ("verify", net, module_ref)
+        if force:
+            self.in_flight.forget(key)
+        failure = self.in_flight.recent_failure(key)
+        if failure is not None:
+            # failed moments ago; store that outcome again, without a new notification
+            await self.save_and_send(
+                net, module_ref, failure, module_name, notify=False
+            )
+            return
 
-        file_path = Path(f"tmp/{module_ref}.out")
-        if file_path.exists():
-            file_path.unlink()
+        await self.in_flight.run(
+            key,
+            lambda: self.run_verification(
+                net,
+                concordium_client,
+                module_ref,
+                module_name,
+                force,
+                context,
+                backlog,
+                notify,
+            ),
+            is_failure=lambda verification: verification is not None
+            and verification.verification_status == "verified_failed",
+        )
 
-        db_to_use = self.motor_mainnet if net == NET.MAINNET else self.motor_testnet
+    async def run_verification(
+        self,
+        net: NET,
+        concordium_client: ConcordiumClient,
+        module_ref: str,
+        module_name: Optional[str],
+        force: bool,
+        context: Optional[ModuleContext],
+        backlog: bool = False,
+        notify: bool = True,
+    ) -> Optional[ModuleVerification]:
+        """
+        Claims the verification lease of the module, runs the verification and
+        stores the result. Returns None if another owner holds the lease.
+        """
+        self.verification_pipeline: Pipeline
+        self.verification_lease: VerificationLease
+        self.write_buffer: WriteBuffer
 
-        concordium_client.save_module(net, module_ref)
+        # the claim must see the module document, including a pending replacement
+        if self.write_buffer.has_pending(net, Collections.modules, module_ref):
+            await self.write_buffer.flush(net, Collections.modules)
 
-        cargo_run = subprocess.run(
-            [
-                "cargo",
-                "concordium",
-                "print-build-info",
-                "--module",
-                f"tmp/{module_ref}.out",
-            ],
-            capture_output=True,
-            text=True,
-        )
-        ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
-        result = ansi_escape.sub("", cargo_run.stderr)
-        output_list = result.splitlines()
-        verification = None
-
-        if len(output_list) == 4:
-            build_image_used = output_list[0].split("used: ")[1].strip()
-            build_command_used = output_list[1].split("used: ")[1].strip()
-            archive_hash = output_list[2].split("archive: ")[1].strip()
-
-            if "source code: " not in output_list[3]:
-                verification = ModuleVerification(
-                    verified=False,
-                    verification_status="verified_failed",
-                    verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                    explanation="No source code found.",
-                )
-                await self.save_and_send(net, module_ref, db_to_use, verification)
+        async with self.verification_lease.hold(net, module_ref) as claimed:
+            if not claimed:
+                console.log(f"{net.value}: {module_ref} is verified by another owner.")
                 return None
-            else:
-                link_to_source_code = output_list[3].split("source code: ")[1].strip()
-                source_code_at_verification_time = ""
+            job = VerificationJob(
+                net,
+                module_ref,
+                concordium_client,
+                force=force,
+                backlog=backlog,
+                context=context,
+            )
+            try:
+                with metrics.span("verification"):
+                    verification = await self.verification_pipeline.submit(job)
+            finally:
+                await asyncio.to_thread(job.remove_scratch)
+            metrics.inc(
+                "verifications_total",
+                net=net.value,
+                status=verification.verification_status,
+            )
+            await self.save_and_send(
+                net, module_ref, verification, module_name, notify=notify
+            )
+            return verification
+
+    def verification_stages(self) -> list[Stage]:
+        return [
+            Stage(
+                "download",
+                self.stage_download_module,
+                VERIFY_DOWNLOAD_WORKERS,
+                VERIFY_QUEUE_SIZE,
+                VERIFY_BACKLOG_SHARE,
+            ),
+            Stage(
+                "build_info",
+                self.stage_build_info,
+                VERIFY_BUILD_INFO_WORKERS,
+                VERIFY_QUEUE_SIZE,
+                VERIFY_BACKLOG_SHARE,
+            ),
+            Stage(
+                "source",
+                self.stage_fetch_source,
+                VERIFY_SOURCE_WORKERS,
+                VERIFY_QUEUE_SIZE,
+                VERIFY_BACKLOG_SHARE,
+            ),
+            Stage(
+                "verify_build",
+                self.stage_verify_build,
+                VERIFY_BUILD_WORKERS,
+                VERIFY_QUEUE_SIZE,
+                VERIFY_BACKLOG_SHARE,
+            ),
+        ]
 
-                try:
-                    response = await httpx.AsyncClient().get(
-                        url=link_to_source_code, follow_redirects=True
-                    )
-                    response.raise_for_status()
-                except httpx.HTTPError as exc:
-                    print(f"HTTP Exception for {exc.request.url} - {exc}")
-                    verification = ModuleVerification(
-                        verified=False,
-                        verification_status="verified_failed",
-                        verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                        explanation=f"HTTP Exception for {exc.request.url} - {exc}",
-                        build_image_used=build_image_used,
-                        build_command_used=build_command_used,
-                        archive_hash=archive_hash,
-                        link_to_source_code=link_to_source_code,
-                        source_code_at_verification_time="",
-                    )
-                    await self.save_and_send(net, module_ref, db_to_use, verification)
-                    return None
-                try:
-                    source_code_at_verification_time = response.content
-                    module_folder = tarfile.open(
-                        fileobj=io.BytesIO(source_code_at_verification_time), mode="r:*"
-                    )
-                    print(f"{link_to_source_code=} retrieved.")
-                    module_folder.extractall(path=f"tmp/source_{module_ref}")
-                    module_name_on_disk = next(os.walk(f"tmp/source_{module_ref}"))[1][
-                        0
-                    ]
-                    with open(
-                        f"tmp/source_{module_ref}/{module_name_on_disk}/src/lib.rs", "r"
-                    ) as file:
-                        source_code_at_verification_time = file.read()
-
-                except Exception as e:  # noqa: E722
-                    print(f"EXCEPTION: {e}")
-                    verification = ModuleVerification(
-                        verified=False,
-                        verification_status="verified_failed",
-                        verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                        explanation=e,
-                        build_image_used=build_image_used,
-                        build_command_used=build_command_used,
-                        archive_hash=archive_hash,
-                        link_to_source_code=link_to_source_code,
-                        source_code_at_verification_time="",
-                    )
-                    await self.save_and_send(net, module_ref, db_to_use, verification)
-                    return None
+    async def stage_download_module(self, job: VerificationJob):
+        self.module_store: ModuleStore
 
-                print(
-                    f"{dt.datetime.now().astimezone(dt.UTC)}: Starting subprocess.run for verify-build..."
-                )
+        if job.context and job.context.module_path:
+            # written by get_module_metadata while handling this message
+            job.module_path = job.context.module_path
+            return
 
-                module_path = f"tmp/{module_ref}.out"
-                project_root = self.get_project_root()
-                module_path = os.path.join(project_root, "tmp", f"{module_ref}.out")
+        if self.module_store.has(job.module_ref):
+            self.module_store.touch(job.module_ref)
+        else:
+            out_path = job.scratch(f"{job.module_ref}.out")
+            with metrics.span("save_module"):
+                await job.concordium_client.save_module(
+                    job.net, job.module_ref, out_path
+                )
+            if not os.path.exists(out_path):
+                job.verification = job.failed("Module could not be retrieved.")
+                return
+            self.module_store.adopt(job.module_ref, out_path)
 
-                source_dir = f"tmp/source_{module_ref}"
-                if os.path.exists(source_dir):
-                    shutil.rmtree(source_dir)
-                os.makedirs(source_dir, exist_ok=True)
+        job.module_path = str(self.module_store.path(job.module_ref))
 
-                try:
-                    module_folder.extractall(path=source_dir)
-                    module_name_on_disk = next(os.walk(source_dir))[1][0]
-                    build_dir = os.path.join(source_dir, module_name_on_disk)
-
-                    # Run verify-build from source directory
-                    cargo_run = subprocess.run(
-                        [
-                            "cargo",
-                            "concordium",
-                            "verify-build",
-                            "--module",
-                            module_path,
-                        ],
-                        capture_output=True,
-                        text=True,
-                        cwd=build_dir,  # Run from source directory
+    async def stage_build_info(self, job: VerificationJob):
+        """
+        Reads the build information from the module's `concordium-build-info`
+        section. A module without the section fails right away; only a section
+        this reader does not understand is handed to `print-build-info`.
+        """
+        self.module_store: ModuleStore
+
+        info = None
+        wasm = job.context.wasm if job.context else None
+        if wasm is None:
+            source = self.module_store.get_source(job.module_ref)
+            wasm = source[1] if source else None
+        if wasm is not None:
+            try:
+                with metrics.span("read_build_info"):
+                    info = build_info(wasm)
+                if info is None:
+                    job.verification = job.failed(
+                        "No embedded build information found."
                     )
+                    return
+            except (WasmParseError, UnicodeDecodeError) as e:
+                console.log(
+                    f"{job.net.value}: reading the build info of {job.module_ref} failed with {e}, using print-build-info."
+                )
 
-                except Exception as e:
-                    print(f"Build error: {str(e)}")
-                    verification = ModuleVerification(
-                        verified=False,
-                        verification_status="verified_failed",
-                        verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                        explanation=e,
-                        build_image_used=build_image_used,
-                        build_command_used=build_command_used,
-                        archive_hash=archive_hash,
-                        link_to_source_code=link_to_source_code,
-                        source_code_at_verification_time="",
+        if info is not None:
+            job.build_image_used = info.image
+            job.build_command_used = " ".join(info.build_command)
+            job.archive_hash = info.archive_hash
+            if info.source_link is None:
+                job.verification = job.failed("No source code found.")
+                return
+            job.link_to_source_code = info.source_link
+        elif not await self.print_build_info(job):
+            return
+
+        if not job.force:
+            cached = await self.verification_cache.get(job)
+            if cached is not None:
+                print(f"{job.module_ref}: reusing cached verification.")
+                job.verification = cached
+
+    async def print_build_info(self, job: VerificationJob) -> bool:
+        """
+        Fills the build information of the job from `cargo concordium
+        print-build-info`; returns False if the job failed.
+        """
+        with metrics.span("print_build_info"):
+            cargo_run = await run(
+                [
+                    "cargo",
+                    "concordium",
+                    "print-build-info",
+                    "--module",
+                    job.module_path,
+                ],
+                timeout=PRINT_BUILD_INFO_TIMEOUT,
+            )
+        result = ANSI_ESCAPE.sub("", cargo_run.stderr_text)
+        output_list = result.splitlines()
+
+        if len(output_list) != 4:
+            print("No build info found.")
+            job.verification = job.failed("No embedded build information found.")
+            return False
+
+        job.build_image_used = output_list[0].split("used: ")[1].strip()
+        job.build_command_used = output_list[1].split("used: ")[1].strip()
+        job.archive_hash = output_list[2].split("archive: ")[1].strip()
+
+        if "source code: " not in output_list[3]:
+            job.verification = job.failed("No source code found.")
+            return False
+
+        job.link_to_source_code = output_list[3].split("source code: ")[1].strip()
+        return True
+
+    async def stage_fetch_source(self, job: VerificationJob):
+        self.http_client: SourceHttpClient
+
+        archive_path = job.scratch("source.archive")
+        try:
+            try:
+                with metrics.span("http_download"):
+                    size = await self.http_client.download(
+                        job.link_to_source_code, archive_path, MAX_SOURCE_ARCHIVE_BYTES
                     )
-                    await self.save_and_send(net, module_ref, db_to_use, verification)
-                    return None
-
-                if cargo_run.returncode != 0:
-                    print(f"Error: {cargo_run.stderr}")
-                    verification = ModuleVerification(
-                        verified=False,
-                        verification_status="verified_failed",
-                        verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                        explanation="The source does not correspond to the module.",
-                        build_image_used=build_image_used,
-                        build_command_used=build_command_used,
-                        archive_hash=archive_hash,
-                        link_to_source_code=link_to_source_code,
-                        source_code_at_verification_time="",
+                print(f"{job.link_to_source_code=} retrieved ({size} bytes).")
+            except httpx.HTTPError as exc:
+                print(f"HTTP Exception for {exc.request.url} - {exc}")
+                job.verification = job.failed(
+                    f"HTTP Exception for {exc.request.url} - {exc}"
+                )
+                return
+
+            try:
+                with metrics.span("extract"):
+                    await asyncio.to_thread(self.extract_source, job, archive_path)
+            except Exception as e:  # noqa: E722
+                print(f"EXCEPTION: {e}")
+                job.verification = job.failed(str(e))
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+
+    def extract_source(self, job: VerificationJob, archive_path: str):
+        """
+        Extracts the archive in a single streaming pass and keeps the text of
+        `src/lib.rs` for `source_code_at_verification_time`.
+        """
+        source_dir = job.scratch("source")
+        if os.path.exists(source_dir):
+            shutil.rmtree(source_dir)
+        os.makedirs(source_dir, exist_ok=True)
+
+        extracted = 0
+        with tarfile.open(archive_path, mode="r|*") as module_folder:
+            for member in module_folder:
+                extracted += member.size
+                if extracted > MAX_SOURCE_EXTRACTED_BYTES:
+                    raise SourceTooLargeError(
+                        f"Extracted source is larger than {MAX_SOURCE_EXTRACTED_BYTES} bytes."
                     )
-                    await self.save_and_send(net, module_ref, db_to_use, verification)
-                    return None
-
+                module_folder.extract(member, path=source_dir, filter="data")
+
+        module_name_on_disk = next(os.walk(source_dir))[1][0]
+        job.build_dir = os.path.join(source_dir, module_name_on_disk)
+        with open(os.path.join(job.build_dir, "src", "lib.rs"), "r") as file:
+            job.source_code_at_verification_time = file.read()
+
+    async def stage_verify_build(self, job: VerificationJob):
+        self.build_images: BuildImageManager
+
+        # pull a missing build image first, so the pull is not timed as build
+        job.pull_duration = await self.build_images.ensure(job.build_image_used)
+        if job.pull_duration is not None:
+            metrics.observe("image_pull", job.pull_duration)
+        print(f"{dt.datetime.now().astimezone(dt.UTC)}: Starting verify-build...")
+        self.build_images.acquire(job.build_image_used)
+        try:
+            # Run verify-build from source directory
+            cargo_run = await self.run_verify_build(job, VERIFY_BUILD_MODE)
+            job.build_duration = cargo_run.duration
+            if VERIFY_BUILD_MODE == "shared_registry" and not self.build_matches(
+                cargo_run
+            ):
+                # only a match is taken from a build with the shared registry
                 print(
-                    f"{dt.datetime.now().astimezone(dt.UTC)}: Subprocess.run for verify-build done."
+                    f"{job.module_ref}: no match with the shared registry, building isolated."
                 )
-                result = ansi_escape.sub("", cargo_run.stderr)
-                output_list = result.splitlines()
-                verified = output_list[-1] == "Source and module match."
-
-                verification = ModuleVerification(
-                    verified=verified,
-                    verification_status="verified_success",
-                    verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                    explanation=(
-                        "Source and module match."
-                        if verified
-                        else "Source and module do not match."
-                    ),
-                    build_image_used=build_image_used,
-                    build_command_used=build_command_used,
-                    archive_hash=archive_hash,
-                    link_to_source_code=link_to_source_code,
-                    source_code_at_verification_time=source_code_at_verification_time,
-                )
-                await self.save_and_send(net, module_ref, db_to_use, verification)
-        else:
-            verification = ModuleVerification(
-                verified=False,
-                verification_status="verified_failed",
-                verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
-                explanation="No embedded build information found.",
+                cargo_run = await self.run_verify_build(job, "isolated")
+                job.build_duration += cargo_run.duration
+        except Exception as e:
+            print(f"Build error: {str(e)}")
+            job.verification = job.failed(str(e))
+            return
+        finally:
+            self.build_images.release(job.build_image_used)
+            if job.pull_duration is not None:
+                await self.build_images.evict()
+
+        if cargo_run.returncode != 0:
+            print(f"Error: {cargo_run.stderr_text}")
+            job.verification = job.failed(
+                "The source does not correspond to the module."
+            )
+            return
+
+        print(
+            f"{dt.datetime.now().astimezone(dt.UTC)}: verify-build done in {job.build_duration:.1f}s"
+            + (
+                f" (image pulled in {job.pull_duration:.1f}s)."
+                if job.pull_duration is not None
+                else "."
+            )
+        )
+        verified = self.build_matches(cargo_run)
+
+        job.verification = ModuleVerification(
+            verified=verified,
+            verification_status="verified_success",
+            verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
+            explanation=(
+                "Source and module match."
+                if verified
+                else "Source and module do not match."
+            ),
+            build_image_used=job.build_image_used,
+            build_command_used=job.build_command_used,
+            archive_hash=job.archive_hash,
+            link_to_source_code=job.link_to_source_code,
+            source_code_at_verification_time=job.source_code_at_verification_time,
+        )
+        await self.verification_cache.put(job, job.verification)
+
+    async def run_verify_build(self, job: VerificationJob, mode: str) -> CommandResult:
+        """
+        Runs `cargo concordium verify-build` for the job. In the `shared_registry`
+        mode, the cargo registry volume of the build image is mounted into the
+        build container, so crates are downloaded once per image.
+        """
+        self.build_images: BuildImageManager
+
+        env = None
+        if mode == "shared_registry":
+            env = self.build_images.shared_registry_env(
+                job.build_image_used, VERIFY_CARGO_REGISTRY_PATH
+            )
+        with metrics.span(f"verify_build_{mode}"):
+            return await run(
+                [
+                    "cargo",
+                    "concordium",
+                    "verify-build",
+                    "--module",
+                    job.module_path,
+                ],
+                timeout=VERIFY_BUILD_TIMEOUT,
+                cwd=job.build_dir,
+                env=env,
             )
-            await self.save_and_send(net, module_ref, db_to_use, verification)
-            print("No build info found.")
-            return None
+
+    def build_matches(self, cargo_run: CommandResult) -> bool:
+        if cargo_run.returncode != 0:
+            return False
+        output_list = ANSI_ESCAPE.sub("", cargo_run.stderr_text).splitlines()
+        return bool(output_list) and output_list[-1] == "Source and module match."
 
     async def save_and_send(
-        self, net, module_ref, db_to_use, verification: ModuleVerification
+        self,
+        net: NET,
+        module_ref: str,
+        verification: ModuleVerification,
+        module_name: Optional[str] = None,
+        notify: bool = True,
     ):
         """
         Asynchronously saves the module verification status to the database and sends a notification.
         Args:
-            net (Network): The network instance.
+            net (NET): The network type (mainnet or testnet).
             module_ref (str): The reference ID of the module.
-            db_to_use (Database): The database instance to use for saving the verification status.
             verification (ModuleVerification): The verification object containing the verification status and explanation.
+            module_name (str, optional): The name of the module, used in the notification.
+            notify (bool, optional): Whether to send the notification.
         Returns:
             None
         Side Effects:
-            - Updates the module's verification status in the database.
-            - Sends a notification message to the tooter service.
+            - Buffers a `$set` of the module's verification in the write buffer.
+            - Sends a notification message to the tooter service, if `notify` is set.
         Example:
-            await save_and_send(net, module_ref, db_to_use, verification)
+            await save_and_send(net, module_ref, verification, module_name)
         """
-        print(f"{module_ref=}: verified status {verification.verified=}")
-        module_from_collection = await db_to_use[Collections.modules].find_one(
-            {"_id": module_ref}
-        )
+        self.write_buffer: WriteBuffer
 
-        module_from_collection.update(
-            {"verification": verification.model_dump(exclude_none=True)}
-        )
-
-        _ = await db_to_use[Collections.modules].bulk_write(
-            [ReplaceOne({"_id": module_ref}, module_from_collection, upsert=True)]
+        print(f"{module_ref=}: verified status {verification.verified=}")
+        await self.write_buffer.set(
+            net,
+            Collections.modules,
+            module_ref,
+            {"verification": verification.model_dump(exclude_none=True)},
         )
-        tooter_message = f"{net.value}: Module {module_ref} with name {module_from_collection['module_name']} added verification with status {verification.verified}. Explanation: {verification.explanation}."
+        if not notify:
+            return
+        tooter_message = f"{net.value}: Module {module_ref} with name {module_name} added verification with status {verification.verified}. Explanation: {verification.explanation}."
         self.send_to_tooter(tooter_message)
@@ -0,0 +1,107 @@
+import os
+import shutil
+import struct
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from concordium_client import versioned_module
+from rich.console import Console
+
+console = Console()
+
+
+class ModuleStore:
+    """
+    On-disk store of deployed modules, addressed by module_ref.
+
+    Modules are kept in the versioned module format (`.out` files as written by
+    `concordium-client module show --out`): a big-endian u32 Wasm version, a
+    big-endian u32 length and the Wasm bytes. That is the format
+    `cargo concordium` reads with `--module`, so the verification tools use the
+    stored file directly. Files are sharded as `ab/cd/abcd....out` and evicted
+    least recently used first once the store grows beyond `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root).absolute()
+        self.max_bytes = max_bytes
+        # module_ref -> size in bytes, least recently used first
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.total_bytes = 0
+        self.load()
+
+    def load(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.root.glob("*/*/*.out"):
+            stat = path.stat()
+            found.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, module_ref, size in sorted(found):
+            self.entries[module_ref] = size
+            self.total_bytes += size
+
+    def path(self, module_ref: str) -> Path:
+        return self.root / module_ref[:2] / module_ref[2:4] / f"{module_ref}.out"
+
+    def has(self, module_ref: str) -> bool:
+        return module_ref in self.entries and self.path(module_ref).exists()
+
+    def touch(self, module_ref: str):
+        self.entries.move_to_end(module_ref)
+        os.utime(self.path(module_ref))
+
+    def get(self, module_ref: str) -> Optional[bytes]:
+        if not self.has(module_ref):
+            return None
+        self.touch(module_ref)
+        return self.path(module_ref).read_bytes()
+
+    def get_source(self, module_ref: str) -> Optional[tuple[int, bytes]]:
+        """
+        Returns the Wasm version and the Wasm bytes of a stored module.
+        """
+        data = self.get(module_ref)
+        if data is None:
+            return None
+        version, length = struct.unpack(">II", data[:8])
+        return version, data[8 : 8 + length]
+
+    def put(self, module_ref: str, data: bytes) -> Path:
+        path = self.path(module_ref)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".partial")
+        partial.write_bytes(data)
+        os.replace(partial, path)
+        self.register(module_ref, len(data))
+        return path
+
+    def put_source(self, module_ref: str, version: int, wasm: bytes) -> Path:
+        return self.put(module_ref, versioned_module(version, wasm))
+
+    def adopt(self, module_ref: str, file_path: str) -> Path:
+        """
+        Moves a module file written elsewhere (e.g. by concordium-client) into the store.
+        """
+        path = self.path(module_ref)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(file_path, path)
+        self.register(module_ref, path.stat().st_size)
+        return path
+
+    def register(self, module_ref: str, size: int):
+        if module_ref in self.entries:
+            self.total_bytes -= self.entries.pop(module_ref)
+        self.entries[module_ref] = size
+        self.total_bytes += size
+        self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            module_ref, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                self.path(module_ref).unlink()
+            except FileNotFoundError:
+                pass
+            console.log(f"Module store: evicted {module_ref} ({size} bytes).")
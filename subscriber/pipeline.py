@@ -0,0 +1,201 @@
+import asyncio
+import datetime as dt
+import itertools
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.mongodb import ModuleVerification
+from concordium_client import ConcordiumClient
+from rich.console import Console
+
+from .context import ModuleContext
+
+console = Console()
+
+
+@dataclass
+class VerificationJob:
+    """
+    The state of one module verification as it moves through the pipeline.
+    A stage ends the job early by setting `verification`. Backlog jobs (from
+    cleanup and lease reclaims) run after live jobs.
+    """
+
+    net: NET
+    module_ref: str
+    concordium_client: ConcordiumClient
+    force: bool = False
+    backlog: bool = False
+    context: Optional[ModuleContext] = None
+    build_image_used: Optional[str] = None
+    build_command_used: Optional[str] = None
+    archive_hash: Optional[str] = None
+    link_to_source_code: Optional[str] = None
+    source_code_at_verification_time: str = ""
+    module_path: Optional[str] = None
+    build_dir: Optional[str] = None
+    # scratch directory of this job below tmp/, created on first use
+    workdir: Optional[str] = None
+    # seconds spent pulling the build image and running verify-build
+    pull_duration: Optional[float] = None
+    build_duration: Optional[float] = None
+    verification: Optional[ModuleVerification] = None
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+    def scratch(self, name: str) -> str:
+        """
+        A path in the job's own scratch directory. The same module can be
+        verified on both networks at once, so paths are not keyed by module_ref.
+        """
+        if self.workdir is None:
+            os.makedirs("tmp", exist_ok=True)
+            self.workdir = tempfile.mkdtemp(
+                prefix=f"{self.net.value}_{self.module_ref[:16]}_", dir="tmp"
+            )
+        return os.path.join(self.workdir, name)
+
+    def remove_scratch(self):
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def rank(self) -> int:
+        # mainnet before testnet
+        return 0 if self.net == NET.MAINNET else 1
+
+    def failed(self, explanation: str) -> ModuleVerification:
+        return ModuleVerification(
+            verified=False,
+            verification_status="verified_failed",
+            verification_timestamp=dt.datetime.now().astimezone(dt.UTC),
+            explanation=explanation,
+            build_image_used=self.build_image_used,
+            build_command_used=self.build_command_used,
+            archive_hash=self.archive_hash,
+            link_to_source_code=self.link_to_source_code,
+            source_code_at_verification_time=("" if self.link_to_source_code else None),
+        )
+
+
+# tie-breaker, so jobs of the same rank keep their order
+sequence = itertools.count()
+
+
+class Stage:
+    """
+    A step of the pipeline with its workers and two bounded priority queues:
+    live jobs, and backlog jobs that are only taken when no live job waits.
+    At most `backlog_share` of the workers (at least one) run backlog jobs at
+    a time, so the others stay free for live jobs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[VerificationJob], Awaitable],
+        workers: int,
+        queue_size: int,
+        backlog_share: float = 1.0,
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.live: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.backlog: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.backlog_limit = max(1, int(self.workers * backlog_share))
+        self.backlog_in_flight = 0
+        self.ready = asyncio.Condition()
+        self.in_flight = 0
+
+    async def put(self, job: VerificationJob):
+        queue = self.backlog if job.backlog else self.live
+        await queue.put((job.rank(), next(sequence), job))
+        async with self.ready:
+            self.ready.notify()
+
+    async def get(self) -> VerificationJob:
+        async with self.ready:
+            while True:
+                if not self.live.empty():
+                    return self.live.get_nowait()[-1]
+                if (
+                    not self.backlog.empty()
+                    and self.backlog_in_flight < self.backlog_limit
+                ):
+                    self.backlog_in_flight += 1
+                    return self.backlog.get_nowait()[-1]
+                await self.ready.wait()
+
+    async def done(self, job: VerificationJob):
+        if job.backlog:
+            async with self.ready:
+                self.backlog_in_flight -= 1
+                self.ready.notify()
+
+    def qsize(self) -> int:
+        return self.live.qsize() + self.backlog.qsize()
+
+
+class Pipeline:
+    """
+    Runs verification jobs through a chain of stages. Every stage has its own
+    bounded queue and pool of workers, so cheap stages keep feeding the
+    expensive `verify-build` stage while it is busy. A full queue blocks the
+    stage before it (backpressure), all the way back to `submit`. Within a
+    stage, live jobs go before backlog jobs and mainnet before testnet.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self.workers: list[asyncio.Task] = []
+
+    def start(self):
+        if self.workers:
+            return
+        for index, stage in enumerate(self.stages):
+            for worker_index in range(stage.workers):
+                self.workers.append(
+                    asyncio.create_task(
+                        self.worker(index), name=f"{stage.name}-worker-{worker_index}"
+                    )
+                )
+
+    async def submit(self, job: VerificationJob) -> ModuleVerification:
+        self.start()
+        job.future = asyncio.get_running_loop().create_future()
+        await self.stages[0].put(job)
+        return await job.future
+
+    async def worker(self, index: int):
+        stage = self.stages[index]
+        while True:
+            job = await stage.get()
+            stage.in_flight += 1
+            try:
+                await stage.handler(job)
+            except Exception as e:
+                console.log(f"{job.module_ref}: stage {stage.name} failed with {e}.")
+                job.verification = job.failed(str(e))
+            finally:
+                stage.in_flight -= 1
+
+            try:
+                if job.verification is None and index < len(self.stages) - 1:
+                    await self.stages[index + 1].put(job)
+                elif not job.future.done():
+                    if job.verification is None:
+                        job.verification = job.failed("Verification did not complete.")
+                    job.future.set_result(job.verification)
+            finally:
+                # a backlog job keeps its slot until the next stage has taken it,
+                # so workers blocked on a full backlog queue count against the limit
+                await stage.done(job)
+
+    def queue_depths(self) -> dict[str, int]:
+        return {stage.name: stage.qsize() for stage in self.stages}
+
+    def in_flight(self) -> dict[str, int]:
+        return {stage.name: stage.in_flight for stage in self.stages}
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Hashable, Optional
+
+from rich.console import Console
+
+console = Console()
+
+
+class SingleFlight:
+    """
+    Registry of work in flight, keyed by e.g. `(net, module_ref)`.
+
+    `run` starts the work for a key unless it is already running; concurrent
+    callers for the same key wait on the one shared result. Results for which
+    `is_failure` holds are remembered for `negative_ttl` seconds and can be
+    looked up with `recent_failure`, so a module that just failed is not
+    retried right away.
+    """
+
+    def __init__(self, negative_ttl: float):
+        self.negative_ttl = negative_ttl
+        self.in_flight: dict[Hashable, asyncio.Future] = {}
+        # key -> (expires at, result)
+        self.failures: dict[Hashable, tuple[float, object]] = {}
+
+    def recent_failure(self, key: Hashable) -> Optional[object]:
+        expires, result = self.failures.get(key, (0, None))
+        if expires < time.monotonic():
+            self.failures.pop(key, None)
+            return None
+        return result
+
+    def forget(self, key: Hashable):
+        self.failures.pop(key, None)
+
+    async def run(
+        self,
+        key: Hashable,
+        work: Callable[[], Awaitable],
+        is_failure: Optional[Callable[[object], bool]] = None,
+    ):
+        future = self.in_flight.get(key)
+        if future is not None:
+            console.log(f"{key}: already in flight, waiting for its result.")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # mark the outcome as retrieved, also when nobody else is waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.in_flight[key] = future
+        try:
+            result = await work()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self.in_flight[key]
+
+        future.set_result(result)
+        if is_failure is not None and is_failure(result):
+            self.failures[key] = (time.monotonic() + self.negative_ttl, result)
+        else:
+            self.failures.pop(key, None)
+        return result
@@ -0,0 +1,68 @@
+import datetime as dt
+import hashlib
+import json
+from typing import Optional
+
+from ccdexplorer_fundamentals.mongodb import ModuleVerification
+from pymongo.collection import Collection
+
+from env import VERIFICATION_CACHE_VERSION
+
+from .pipeline import VerificationJob
+
+
+class VerificationCache:
+    """
+    Persistent cache of `verify-build` outcomes, shared by both networks.
+
+    A build is fully determined by the source archive, the build image, the
+    build command and the module it should reproduce, so the outcome is stored
+    under a hash of exactly those. Only outcomes of a completed `verify-build`
+    are stored; failures to download or build are not.
+    Bumping `VERIFICATION_CACHE_VERSION` invalidates all entries at once.
+    """
+
+    def __init__(self, collection: Collection):
+        self.collection = collection
+
+    def key(self, job: VerificationJob) -> str:
+        parts = [
+            VERIFICATION_CACHE_VERSION,
+            job.archive_hash,
+            job.build_image_used,
+            job.build_command_used,
+            job.module_ref,
+        ]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    async def get(self, job: VerificationJob) -> Optional[ModuleVerification]:
+        entry = await self.collection.find_one({"_id": self.key(job)})
+        if entry is None:
+            return None
+        return ModuleVerification(**entry["verification"])
+
+    async def put(self, job: VerificationJob, verification: ModuleVerification):
+        await self.collection.replace_one(
+            {"_id": self.key(job)},
+            {
+                "_id": self.key(job),
+                "module_ref": job.module_ref,
+                "archive_hash": job.archive_hash,
+                "build_image_used": job.build_image_used,
+                "build_command_used": job.build_command_used,
+                "cached_at": dt.datetime.now().astimezone(dt.UTC),
+                "verification": verification.model_dump(exclude_none=True),
+            },
+            upsert=True,
+        )
+
+    async def invalidate(self, module_ref: Optional[str] = None) -> int:
+        """
+        Removes the entries for `module_ref`, or all entries if it is not given.
+        """
+        query = {"module_ref": module_ref} if module_ref else {}
+        result = await self.collection.delete_many(query)
+        return result.deleted_count
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("module_ref")
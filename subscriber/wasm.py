@@ -0,0 +1,206 @@
+import struct
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+WASM_MAGIC = b"\x00asm"
+CUSTOM_SECTION = 0
+EXPORT_SECTION = 7
+EXPORT_FUNCTION = 0
+# versioned schema first, then the unversioned sections of older modules
+SCHEMA_SECTIONS = ("concordium-schema", "concordium-schema-v2", "concordium-schema-v1")
+# written by `cargo concordium build --verifiable`
+BUILD_INFO_SECTION = "concordium-build-info"
+
+
+class WasmParseError(Exception):
+    pass
+
+
+def read_unsigned(data: bytes, offset: int) -> tuple[int, int]:
+    """
+    Reads an unsigned LEB128 integer at `offset`; returns it and the next offset.
+    """
+    result = shift = 0
+    while True:
+        if offset >= len(data):
+            raise WasmParseError("Unexpected end of module.")
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, offset
+
+
+def read_name(data: bytes, offset: int) -> tuple[str, int]:
+    length, offset = read_unsigned(data, offset)
+    if offset + length > len(data):
+        raise WasmParseError("Name runs past the end of the module.")
+    return data[offset : offset + length].decode("utf-8"), offset + length
+
+
+def sections(wasm: bytes) -> Iterator[tuple[int, int, int]]:
+    """
+    Yields `(section id, start, end)` for every section, using only the
+    length prefixes, so section contents are never decoded.
+    """
+    if wasm[:4] != WASM_MAGIC:
+        raise WasmParseError("Expected .wasm")
+    offset = 8
+    while offset < len(wasm):
+        section_id = wasm[offset]
+        size, start = read_unsigned(wasm, offset + 1)
+        end = start + size
+        if end > len(wasm):
+            raise WasmParseError(
+                f"Section {section_id} runs past the end of the module."
+            )
+        yield section_id, start, end
+        offset = end
+
+
+def exports(wasm: bytes) -> list[tuple[str, int]]:
+    """
+    Returns `(name, kind)` for every entry of the export section.
+    """
+    for section_id, start, end in sections(wasm):
+        if section_id != EXPORT_SECTION:
+            continue
+        count, offset = read_unsigned(wasm, start)
+        entries = []
+        for _ in range(count):
+            name, offset = read_name(wasm, offset)
+            if offset >= end:
+                raise WasmParseError("Export entry runs past its section.")
+            kind = wasm[offset]
+            _, offset = read_unsigned(wasm, offset + 1)
+            entries.append((name, kind))
+        return entries
+    return []
+
+
+def exported_functions(wasm: bytes) -> list[str]:
+    return [name for name, kind in exports(wasm) if kind == EXPORT_FUNCTION]
+
+
+def module_metadata(function_names: list[str]) -> dict:
+    """
+    Derives `module_name` (from the `init_` function) and `methods` (the
+    receive functions, without their contract prefix) from the exported
+    function names.
+    """
+    results = {}
+    for name in function_names:
+        if name[:5] == "init_":
+            results["module_name"] = name[5:]
+        else:
+            method_name = name.split(".")[1] if "." in name else name
+            if "methods" in results:
+                results["methods"].append(method_name)
+            else:
+                results["methods"] = [method_name]
+    return results
+
+
+def custom_sections(wasm: bytes) -> dict[str, bytes]:
+    """
+    Returns the contents of all custom sections by name.
+    """
+    results = {}
+    for section_id, start, end in sections(wasm):
+        if section_id != CUSTOM_SECTION:
+            continue
+        name, offset = read_name(wasm, start)
+        results[name] = wasm[offset:end]
+    return results
+
+
+def embedded_schema(wasm: bytes) -> Optional[tuple[str, bytes]]:
+    """
+    Returns the name and contents of the embedded contract schema section, if any.
+    """
+    found = custom_sections(wasm)
+    for name in SCHEMA_SECTIONS:
+        if name in found:
+            return name, found[name]
+    return None
+
+
+def receive_methods(function_names: list[str]) -> dict[str, list[str]]:
+    """
+    Groups the receive functions (`contract.method`) by contract.
+    """
+    results = {}
+    for name in function_names:
+        if name[:5] == "init_":
+            results.setdefault(name[5:], [])
+        elif "." in name:
+            contract, method = name.split(".", 1)
+            results.setdefault(contract, []).append(method)
+    return results
+
+
+@dataclass
+class BuildInfo:
+    """
+    The embedded build information, as printed by `cargo concordium print-build-info`.
+    """
+
+    image: str
+    build_command: list[str]
+    archive_hash: str
+    source_link: Optional[str]
+
+
+def read_u8(data: bytes, offset: int) -> tuple[int, int]:
+    if offset >= len(data):
+        raise WasmParseError("Build info ends early.")
+    return data[offset], offset + 1
+
+
+def read_u64(data: bytes, offset: int) -> tuple[int, int]:
+    if offset + 8 > len(data):
+        raise WasmParseError("Build info ends early.")
+    return struct.unpack(">Q", data[offset : offset + 8])[0], offset + 8
+
+
+def read_string(data: bytes, offset: int) -> tuple[str, int]:
+    length, offset = read_u64(data, offset)
+    if offset + length > len(data):
+        raise WasmParseError("Build info string runs past the section.")
+    return data[offset : offset + length].decode("utf-8"), offset + length
+
+
+def build_info(wasm: bytes) -> Optional[BuildInfo]:
+    """
+    Reads the `concordium-build-info` section: a version tag (0), the archive
+    hash (32 bytes), the source link (`Option<String>`), the image (`String`)
+    and the build command (`Vec<String>`), with big-endian u64 lengths.
+    Returns None if the module has no such section; raises `WasmParseError`
+    if the section is in a format this reader does not know.
+    """
+    section = custom_sections(wasm).get(BUILD_INFO_SECTION)
+    if section is None:
+        return None
+    version, offset = read_u8(section, 0)
+    if version != 0:
+        raise WasmParseError(f"Unknown build info version {version}.")
+    if offset + 32 > len(section):
+        raise WasmParseError("Build info ends early.")
+    archive_hash = section[offset : offset + 32].hex()
+    offset += 32
+    tag, offset = read_u8(section, offset)
+    if tag not in (0, 1):
+        raise WasmParseError(f"Invalid source link tag {tag}.")
+    source_link = None
+    if tag == 1:
+        source_link, offset = read_string(section, offset)
+    image, offset = read_string(section, offset)
+    count, offset = read_u64(section, offset)
+    build_command = []
+    for _ in range(count):
+        argument, offset = read_string(section, offset)
+        build_command.append(argument)
+    if offset != len(section):
+        raise WasmParseError("Unexpected bytes after the build info.")
+    return BuildInfo(image, build_command, archive_hash, source_link)
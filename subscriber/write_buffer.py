@@ -0,0 +1,144 @@
+import asyncio
+from collections import defaultdict
+from typing import Optional
+
+from ccdexplorer_fundamentals.enums import NET
+from ccdexplorer_fundamentals.mongodb import Collections
+from metrics import metrics
+from pymongo import DeleteOne, ReplaceOne, UpdateOne
+from pymongo.collection import Collection
+from rich.console import Console
+
+console = Console()
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for MongoDB writes, per network and collection.
+
+    Writes are collected per document `_id` and merged: a `$set` on a document
+    with a pending replacement is folded into that replacement, consecutive
+    `$set`s are combined, and a later replacement or delete supersedes what was
+    pending. A collection is flushed as one unordered `bulk_write` once it has
+    `max_ops` pending documents, and all collections are flushed every
+    `interval` seconds. Call `flush_sync` on shutdown to write what is left.
+    """
+
+    def __init__(
+        self,
+        dbs: dict[NET, dict[Collections, Collection]],
+        max_ops: int,
+        interval: float,
+    ):
+        self.dbs = dbs
+        self.max_ops = max_ops
+        self.interval = interval
+        # (net, collection) -> _id -> (kind, payload)
+        self.pending: dict[tuple[NET, Collections], dict] = defaultdict(dict)
+        self.locks: dict[tuple[NET, Collections], asyncio.Lock] = defaultdict(
+            asyncio.Lock
+        )
+        self.flusher: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.flusher is None:
+            self.flusher = asyncio.create_task(self.flush_periodically())
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                console.log(f"Write buffer flush failed with error {e}.")
+
+    async def replace(self, net: NET, collection: Collections, document: dict):
+        await self.add(net, collection, document["_id"], ("replace", document))
+
+    async def set(self, net: NET, collection: Collections, _id, fields: dict):
+        """
+        Buffers a `$set` of top-level `fields` on an existing document.
+        """
+        key = (net, collection)
+        kind, payload = self.pending[key].get(_id, (None, None))
+        if kind == "replace":
+            payload = {**payload, **fields}
+            await self.add(net, collection, _id, ("replace", payload))
+        elif kind == "set":
+            await self.add(net, collection, _id, ("set", {**payload, **fields}))
+        else:
+            await self.add(net, collection, _id, ("set", fields))
+
+    async def delete(self, net: NET, collection: Collections, _id):
+        await self.add(net, collection, _id, ("delete", None))
+
+    async def add(self, net: NET, collection: Collections, _id, op: tuple):
+        self.start()
+        key = (net, collection)
+        self.pending[key][_id] = op
+        if len(self.pending[key]) >= self.max_ops:
+            await self.flush(net, collection)
+
+    def has_pending(self, net: NET, collection: Collections, _id) -> bool:
+        return _id in self.pending.get((net, collection), {})
+
+    def to_operations(self, ops: dict) -> list:
+        operations = []
+        for _id, (kind, payload) in ops.items():
+            if kind == "replace":
+                operations.append(ReplaceOne({"_id": _id}, payload, upsert=True))
+            elif kind == "set":
+                operations.append(UpdateOne({"_id": _id}, {"$set": payload}))
+            else:
+                operations.append(DeleteOne({"_id": _id}))
+        return operations
+
+    def restore(self, key: tuple[NET, Collections], ops: dict):
+        # writes that arrived during the failed flush are newer and win
+        for _id, (kind, payload) in ops.items():
+            newer = self.pending[key].get(_id)
+            if newer is None:
+                self.pending[key][_id] = (kind, payload)
+            elif newer[0] == "set" and kind in ("replace", "set"):
+                self.pending[key][_id] = (kind, {**payload, **newer[1]})
+
+    async def flush(
+        self, net: Optional[NET] = None, collection: Optional[Collections] = None
+    ):
+        keys = [
+            key
+            for key in list(self.pending)
+            if (net is None or key[0] == net)
+            and (collection is None or key[1] == collection)
+        ]
+        for key in keys:
+            async with self.locks[key]:
+                ops = self.pending.pop(key, {})
+                if not ops:
+                    continue
+                try:
+                    with metrics.span("mongo_write"):
+                        await self.dbs[key[0]][key[1]].bulk_write(
+                            self.to_operations(ops), ordered=False
+                        )
+                except BaseException:
+                    self.restore(key, ops)
+                    raise
+
+    def flush_sync(self):
+        """
+        Flushes all pending writes with the synchronous driver, for use when no
+        event loop is running anymore (e.g. from `atexit`).
+        """
+        for key in list(self.pending):
+            ops = self.pending.pop(key, {})
+            if not ops:
+                continue
+            motor_collection = self.dbs[key[0]][key[1]]
+            motor_collection.delegate.bulk_write(self.to_operations(ops), ordered=False)
+            console.log(
+                f"Write buffer: flushed {len(ops)} writes to {key[0].value}/{key[1].value} on exit."
+            )
+
+    def pending_count(self) -> int:
+        return sum(len(ops) for ops in self.pending.values())